@@ -4,20 +4,95 @@ import random
 import asyncio
 import platform
 import os
+import sys
+import argparse
+import hashlib
+import mmap
+import struct
+import time
+import csv
+import json
+import gzip
+import gc
+import tracemalloc
+import types
+import threading
+import io
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict, deque
+from fractions import Fraction
+import numpy as np
+try:
+    from pygame._sdl2 import video as sdl2_video
+except ImportError:
+    sdl2_video = None
 
-# Initialize Pygame
-pygame.init()
-
-# Screen and game settings
+# Screen and game settings, the display itself is opened by init_display()
 WIDTH, HEIGHT = 1920, 1080
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("CONTAİNER TANKER")
+screen = None
 FPS = 120
-TANK_SPEED = 3
-BULLET_SPEED = 10
-TARGET_SPEED = 2
+TICK_RATE = 120
+SIM_DT = 1 / TICK_RATE
+MAX_FRAME_TIME = 0.25
+TANK_SPEED = 360
+TANK_ROTATION_SPEED = 240
+TANK_RECOIL = 5
+BULLET_SPEED = 1200
+TARGET_SPEED = 240
 BULLET_LIFETIME = 2
 VIDEO_FPS = 120
+VIDEO_BUFFER_BYTES = 256 * 1024 * 1024
+VIDEO_FRAMES_DIR = "video_frames"
+FRAME_CACHE = True
+FRAME_CACHE_PATH = os.path.join(VIDEO_FRAMES_DIR, "frames.cache")
+FRAME_CACHE_MAGIC = b"CTFRAMES"
+FRAME_CACHE_HEADER = struct.Struct("<8sIIIII32s")
+FRAME_CACHE_ALIGN = 4096
+RENDER_DIRTY_RECTS = True
+PARTICLE_MAX_SIZE = 12
+PARTICLE_ALPHA_LEVELS = 16
+PARTICLE_POOL_CAPACITY = 64
+PARTICLE_DRAG = 0.92 ** 2
+PARTICLE_SHRINK = 0.95 ** 2
+MIN_RENDER_SCALE = 0.25
+UPSCALE_MAX_RECTS = 128
+RENDER_BACKENDS = ["surface", "texture", "software"]
+ROTATION_STEP = 1
+ROTATION_CACHE_BYTES = 16 * 1024 * 1024
+TITLE_ROTATION_STEP = 0.5
+TEXT_CACHE_SIZE = 256
+GLYPH_CHARACTERS = "0123456789-."
+PROFILE_HISTORY = 600
+PROFILE_PHASES = ["events", "update", "update.tank", "update.bullets", "update.targets", "update.collisions", "update.effects",
+                  "draw", "draw.background", "draw.tank", "draw.bullets", "draw.targets", "draw.effects", "draw.hud",
+                  "draw.upscale", "draw.present", "wait"]
+MEMORY_TRACE_FRAMES = 1
+MEMORY_TOP = 10
+PROFILE_COUNTS = ["bullets", "targets", "effects", "animations", "particles"]
+INPUT_KEYS = [pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d, pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+RECORD_MAGIC = b"CTREC"
+RECORD_VERSION = 5
+RECORD_HEADER = struct.Struct("<5sBQHHH")
+RECORD_FRAME = struct.Struct("<HBhhBH")
+RECORD_EVENT = struct.Struct("<BIhh")
+RECORD_EVENT_TYPES = [pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN]
+COLLISION_CELL_SIZE = 64
+SPATIAL_HASH_MIN_TARGETS = 64
+CELL_KEY_OFFSET = 1 << 16
+CELL_KEY_STRIDE = 1 << 32
+TRAIL_LENGTH = 0.4
+TRACK_COLOR = (100, 100, 100)
+TRACK_WIDTH = 2
+DECAL_FADE_INTERVAL = 1 / 30
+SCORCH_RADIUS = 28
+COLLISION_PARTICLES = 25
+QUALITY_WINDOW = 60
+QUALITY_BUDGET = 1 / FPS
+QUALITY_UPGRADE_HEADROOM = 0.6
+QUALITY_UPGRADE_DELAY = 3.0
+SCORCH_ALPHA = 110
+ASSET_WORKERS = 4
+SPAWN_SAFE_RADIUS = 150
 
 # Colors
 WHITE = (255, 255, 255)
@@ -30,19 +105,78 @@ GRAY = (128, 128, 128)
 LIGHT_YELLOW = (255, 255, 224)
 VIOLET = (138, 43, 226)
 
+# Asset files, images are scaled to the given size while decoding
+AUDIO_CHANNELS = 16
+SOUND_COALESCE_TIME = 0.03
+SOUND_ASSETS = [("shoot_sound", "assets/shoot.wav"), ("collision_sound", "assets/collision.wav"), ("win_sound", "assets/win.wav")]
+IMAGE_ASSETS = [
+    ("go_logo", "assets/go_logo.png", (48, 48)),
+    ("docker_logo", "assets/docker_logo.png", (48, 48)),
+    ("java_logo", "assets/java_logo.png", (48, 48)),
+    ("tank_body_image", "assets/tank_body.png", None),
+    ("tank_turret_image", "assets/tank_turret.png", None),
+    ("bullet_image", "assets/bullet.png", (16, 16))
+]
+MUSIC_FILE = "assets/background.mp3"
+
+# Solid color stand-ins used until, or instead of, the real images
+DEFAULT_IMAGES = {
+    "go_logo": ((48, 48), GREEN),
+    "docker_logo": ((48, 48), WHITE),
+    "java_logo": ((48, 48), RED),
+    "tank_body_image": ((40, 40), GREEN),
+    "tank_turret_image": ((30, 10), YELLOW),
+    "bullet_image": ((16, 16), WHITE)
+}
+
+# Particle palettes
+CELEBRATION_COLORS = (RED, VIOLET, GREEN, YELLOW)
+SPARK_COLORS = tuple((255, green, 0) for green in range(0, 101, 20))
+
+# Pressed keys, indexed like the result of pygame.key.get_pressed()
+class KeyState(frozenset):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        return key in self
+
 # Global state
 game = {
     "state": "menu",
+    "time": 0.0,
     "level": 1,
     "bullets": [],
-    "targets": [],
+    "targets": None,
     "collision_effects": [],
     "animations": [],
     "bullets_left": 0,
     "current_frame_index": 0,
     "last_frame_time": 0,
     "tank": None,
-    "video_frames": []
+    "background_frame": None,
+    "input": {"keys": KeyState(), "mouse_pos": (0, 0), "mouse_pressed": (False, False, False)}
+}
+
+# Level snapshots, the initial simulation state of each level is built once per visit to the menu from its own RNG
+levels = {
+    "seed": 0,
+    "executor": None,
+    "snapshots": {}
+}
+
+# Memory diagnostics, allocations per source line and live surface totals per state, the first record kept as the baseline
+memory = {
+    "enabled": False,
+    "baseline": {},
+    "latest": {},
+    "transitions": {},
+    "own_lines": set()
+}
+
+# Input recorder
+recorder = {
+    "file": None,
+    "frames": 0
 }
 
 # Resources
@@ -63,6 +197,125 @@ res = {
 # UI elements
 ui = {}
 
+# Sound categories: concurrent voices, priority when channels run out (higher wins) and volume relative to the master gain
+SOUND_CATEGORIES = {
+    "shoot_sound": {"voices": 4, "priority": 1, "volume": 1.0},
+    "collision_sound": {"voices": 6, "priority": 2, "volume": 1.0},
+    "win_sound": {"voices": 1, "priority": 3, "volume": 1.0}
+}
+
+# Audio voices, sounds are queued during the simulation and started once per frame by flush_sounds()
+sounds = {
+    "channels": [],
+    "voices": [],
+    "queue": {},
+    "last_played": {},
+    "master": 0.5
+}
+
+# Asset loader, jobs decode on worker threads and are applied on the main thread
+assets = {
+    "executor": None,
+    "pending": [],
+    "total": 0,
+    "done": 0
+}
+
+# Background video stream
+video = {
+    "files": [],
+    "frames": [],
+    "cache": None,
+    "buffer": deque(),
+    "capacity": 0,
+    "position": 0,
+    "condition": threading.Condition(),
+    "worker": None,
+    "running": False,
+    "dropped": 0,
+    "repeated": 0
+}
+
+# Frame profiler, durations are accumulated per frame and stored in a ring buffer
+profiler = {
+    "enabled": False,
+    "overlay": False,
+    "export_path": None,
+    "frames": 0,
+    "frame_start": 0.0,
+    "current": np.zeros(len(PROFILE_PHASES)),
+    "offsets": np.full(len(PROFILE_PHASES), np.nan),
+    "frame_starts": np.zeros(PROFILE_HISTORY),
+    "frame_times": np.zeros(PROFILE_HISTORY),
+    "durations": np.zeros((PROFILE_HISTORY, len(PROFILE_PHASES))),
+    "phase_offsets": np.zeros((PROFILE_HISTORY, len(PROFILE_PHASES))),
+    "counts": np.zeros((PROFILE_HISTORY, len(PROFILE_COUNTS)), dtype=int)
+}
+PROFILE_INDEX = {phase: index for index, phase in enumerate(PROFILE_PHASES)}
+
+# Renderer state, the world is drawn at scale times the window resolution and upscaled once when scale is below 1.
+# The texture backends draw through an SDL renderer instead, the surface named screen is then only the UI overlay
+render = {
+    "backend": "surface",
+    "window": None,
+    "renderer": None,
+    "textures": {},
+    "particle_texture": None,
+    "background_texture": None,
+    "background_base": None,
+    "overlay_texture": None,
+    "scale": 1.0,
+    "base_scale": 1.0,
+    "upscale_tile": None,
+    "world": None,
+    "prev_ui_rects": [],
+    "view_images": {},
+    "view_background": None,
+    "view_background_source": None,
+    "background": None,
+    "last_background": None,
+    "dirty_rects": [],
+    "prev_dirty_rects": [],
+    "full_redraw": True,
+    "particle_atlases": {},
+    "rotation_cache": OrderedDict(),
+    "rotation_cache_bytes": 0,
+    "text_cache": OrderedDict(),
+    "glyph_atlases": {}
+}
+
+# Decal layers drawn between the background and the entities, tracks fade out in bulk and scorch marks stay for the level
+decals = {
+    "tracks": None,
+    "tracks_bounds": None,
+    "scorch": None,
+    "scorch_bounds": None,
+    "scorch_sprite": None,
+    "composite": None,
+    "composite_background": None,
+    "track_stamps": deque(),
+    "last_track": None,
+    "fade_time": 0.0,
+    "changed": []
+}
+
+# Quality levels from cheapest to best, the governor moves one step at a time
+QUALITY_LEVELS = [
+    {"name": "low", "particles": 0.25, "trail": 0.25, "video_fps": 30, "render_scale": 0.5},
+    {"name": "medium", "particles": 0.5, "trail": 0.5, "video_fps": 60, "render_scale": 0.75},
+    {"name": "high", "particles": 0.75, "trail": 0.75, "video_fps": 60, "render_scale": 1.0},
+    {"name": "ultra", "particles": 1.0, "trail": 1.0, "video_fps": VIDEO_FPS, "render_scale": 1.0}
+]
+
+# Quality governor, work time per frame is sampled by main() and compared against the frame budget
+quality = {
+    "level": len(QUALITY_LEVELS) - 1,
+    "pinned": False,
+    "frame_times": deque(maxlen=QUALITY_WINDOW),
+    "last_change": 0.0,
+    "changes": 0
+}
+
 # Level configurations
 level_configs = [
     {"bullets": 5, "targets": 5, "image": None, "title": "GO Developer"},
@@ -70,75 +323,240 @@ level_configs = [
     {"bullets": 15, "targets": 15, "image": None, "title": "Kubernetes Architect"}
 ]
 
+# Initialization
+def init_display(size=(WIDTH, HEIGHT), audio=True, backend="surface"):
+    # Opens the window, and the mixer when audio is on. Importing the module touches neither
+    global screen
+    set_resolution(size)
+    pygame.display.init()
+    pygame.font.init()
+    if audio:
+        try:
+            pygame.mixer.init()
+            init_audio()
+        except pygame.error as e:
+            print(f"Audio disabled: {e}")
+    if backend != "surface":
+        try:
+            open_renderer(backend == "software")
+            return screen
+        except pygame.error as e:
+            print(f"Texture renderer unavailable, drawing with surfaces: {e}")
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("CONTAİNER TANKER")
+    return screen
+
+def init_headless(size=(WIDTH, HEIGHT)):
+    # Simulation only: no window, mixer or fonts, images are loaded unconverted
+    set_resolution(size)
+    load_resources()
+    create_ui()
+
+def set_resolution(size):
+    # The playfield is the window, targets bounce and the tank is clamped within it
+    global WIDTH, HEIGHT
+    WIDTH, HEIGHT = size
+    render["background"] = None
+    reset_view()
+
+def set_render_size(size):
+    # Internal resolution for the world, as a uniform scale of the window that the quality governor scales further
+    render["base_scale"] = min(size[0] / WIDTH, size[1] / HEIGHT, 1.0)
+    set_render_scale(render["base_scale"] * quality_settings()["render_scale"])
+
+def set_render_scale(scale):
+    # The renderer scales textures itself, so the texture backends always draw at window resolution
+    scale = 1.0 if render["renderer"] is not None else max(MIN_RENDER_SCALE, min(scale, 1.0))
+    ratio = Fraction(scale).limit_denominator(64)
+    exact = abs(ratio - scale) < 1e-9
+    if exact:
+        scale = float(ratio)
+    if scale != render["scale"]:
+        factor = scale / render["scale"]
+        render["scale"] = scale
+        reset_view(factor)
+    
+    # Blocks of p world pixels map to exactly q window pixels, so a dirty region can be upscaled
+    # on its own and match a full-frame upscale. Scales without such a block always upscale the whole frame
+    p, q = ratio.numerator, ratio.denominator
+    render["upscale_tile"] = (p, q) if exact and scale < 1 and WIDTH * p % q == 0 and HEIGHT * p % q == 0 else None
+
+def reset_view(decal_factor=None):
+    # Everything sized in world pixels is rebuilt lazily at the new size. A new render scale resamples the decals
+    # by decal_factor so a quality step keeps the level's tracks and scorch marks, a new window starts them over
+    render["world"] = None
+    render["view_images"] = {}
+    render["view_background"] = None
+    render["view_background_source"] = None
+    render["background_texture"] = None
+    render["overlay_texture"] = None
+    render["full_redraw"] = True
+    decals["scorch_sprite"] = None
+    decals["composite"] = None
+    if decal_factor is None:
+        decals["tracks"] = None
+        decals["scorch"] = None
+        clear_decals()
+    else:
+        rescale_decals(decal_factor)
+
 # Load resources
-def load_resources():
-    # Load sounds
-    try:
-        for sound_name, file_name in [("shoot_sound", "assets/shoot.wav"), ("collision_sound", "assets/collision.wav"), ("win_sound", "assets/win.wav")]:
-            if os.path.exists(file_name):
-                res[sound_name] = pygame.mixer.Sound(file_name)
-        if os.path.exists('assets/background.mp3'):
-            pygame.mixer.music.load('assets/background.mp3')
-            pygame.mixer.music.set_volume(0.5)
-            pygame.mixer.music.play(-1)
-    except pygame.error as e:
-        print(f"Sound loading error: {e}")
-    
-    # Load fonts
-    res["FONT"] = pygame.font.SysFont("Agency FB", 72)
-    res["PENALTY_FONT"] = pygame.font.SysFont("Agency FB", 26)
-    
-    # Create default images
-    images = {
-        "go_logo": (pygame.Surface((48, 48)), GREEN),
-        "docker_logo": (pygame.Surface((48, 48)), WHITE),
-        "java_logo": (pygame.Surface((48, 48)), RED),
-        "tank_body_image": (pygame.Surface((40, 40)), GREEN),
-        "tank_turret_image": (pygame.Surface((30, 10)), YELLOW),
-        "bullet_image": (pygame.Surface((16, 16)), WHITE)
-    }
+def display_format(surface, alpha=False):
+    # Only a set_mode window has a pixel format to match, headless and the texture backends keep the surface as is
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+def load_image_file(file_name, size):
+    # Runs on a loader thread: decoding and scaling only, display conversion happens on the main thread
+    image = pygame.image.load(file_name)
+    if size is not None:
+        image = pygame.transform.scale(image, size)
+    return image
+
+def load_music_file(file_name):
+    with open(file_name, "rb") as f:
+        return io.BytesIO(f.read())
+
+def load_video_frames():
+    files = list_video_frames()
+    cached = open_frame_cache(files, FRAME_CACHE_PATH) if FRAME_CACHE and files else None
+    return files, cached
+
+def submit_asset(kind, name, critical, func, *args):
+    if assets["executor"] is None:
+        # Emscripten has no threads, the job runs right away and is applied on the next poll
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+    else:
+        future = assets["executor"].submit(func, *args)
+    assets["pending"].append((kind, name, critical, future))
+    if critical:
+        assets["total"] += 1
+
+def start_loading_assets():
+    if platform.system() != "Emscripten":
+        assets["executor"] = ThreadPoolExecutor(max_workers=ASSET_WORKERS, thread_name_prefix="asset-loader")
+    assets["pending"] = []
+    assets["total"] = 0
+    assets["done"] = 0
+    
+    # Load fonts, the loading screen needs them straight away
+    if pygame.font.get_init():
+        res["FONT"] = pygame.font.SysFont("Agency FB", 72)
+        res["PENALTY_FONT"] = pygame.font.SysFont("Agency FB", 26)
     
-    # Fill default images with colors
-    for name, (surface, color) in images.items():
+    # Create default images, replaced as the real ones arrive
+    for name, (size, color) in DEFAULT_IMAGES.items():
+        surface = pygame.Surface(size)
         surface.fill(color)
-        res[name] = surface
+        res[name] = display_format(surface)
+    assign_level_images()
     
-    # Try to load actual images
-    try:
-        for img_name, file_name in [
-            ("go_logo", "assets/go_logo.png"), 
-            ("docker_logo", "assets/docker_logo.png"), 
-            ("java_logo", "assets/java_logo.png"),
-            ("tank_body_image", "assets/tank_body.png"),
-            ("tank_turret_image", "assets/tank_turret.png"),
-            ("bullet_image", "assets/bullet.png")
-        ]:
+    # Sounds and images are needed before the menu, music and background frames can stream in behind it.
+    # Without a mixer or a window only the images are loaded, their sizes drive the simulation
+    for image_name, file_name, size in IMAGE_ASSETS:
+        if os.path.exists(file_name):
+            submit_asset("image", image_name, True, load_image_file, file_name, size)
+    if pygame.mixer.get_init():
+        for sound_name, file_name in SOUND_ASSETS:
             if os.path.exists(file_name):
-                img = pygame.image.load(file_name)
-                if img_name in ["go_logo", "docker_logo", "java_logo"]:
-                    img = pygame.transform.scale(img, (48, 48))
-                elif img_name == "bullet_image":
-                    img = pygame.transform.scale(img, (16, 16))
-                res[img_name] = img
-    except pygame.error as e:
-        print(f"Image loading error: {e}")
-    
-    # Load video frames
-    video_frames_dir = 'video_frames'
-    if os.path.exists(video_frames_dir):
+                submit_asset("sound", sound_name, True, pygame.mixer.Sound, file_name)
+        if os.path.exists(MUSIC_FILE):
+            submit_asset("music", MUSIC_FILE, False, load_music_file, MUSIC_FILE)
+    if screen is not None:
+        submit_asset("video", VIDEO_FRAMES_DIR, False, load_video_frames)
+
+def apply_asset(kind, name, result):
+    if kind == "image":
+        # Convert once to the display format so later blits are plain copies
+        res[name] = display_format(result, result.get_flags() & pygame.SRCALPHA)
+        assign_level_images()
+    elif kind == "sound":
+        res[name] = result
+    elif kind == "music":
+        pygame.mixer.music.load(result, os.path.splitext(name)[1][1:])
+        pygame.mixer.music.set_volume(sounds["master"])
+        pygame.mixer.music.play(-1)
+    elif kind == "video":
+        files, cached = result
+        video["files"] = files
+        if cached is not None:
+            video["cache"], video["frames"] = cached
+
+def poll_assets(wait=False):
+    # Apply finished jobs on the main thread, returns the progress of the critical assets
+    pending = []
+    for kind, name, critical, future in assets["pending"]:
+        if not wait and not future.done():
+            pending.append((kind, name, critical, future))
+            continue
         try:
-            frame_files = sorted([f for f in os.listdir(video_frames_dir) if f.endswith('.png')])
-            for frame_file in frame_files:
-                frame = pygame.transform.scale(pygame.image.load(os.path.join(video_frames_dir, frame_file)), (WIDTH, HEIGHT))
-                game["video_frames"].append(frame)
-        except Exception as e:
-            print(f"Video frame loading error: {e}")
-    
-    # Update level configs with loaded images
+            apply_asset(kind, name, future.result())
+        except (pygame.error, OSError, ValueError) as e:
+            print(f"{kind.capitalize()} loading error ({name}): {e}")
+        if critical:
+            assets["done"] += 1
+    assets["pending"] = pending
+    if not pending and assets["executor"] is not None:
+        assets["executor"].shutdown(wait=False)
+        assets["executor"] = None
+    return assets["done"], assets["total"]
+
+def assets_ready():
+    return all(not critical for kind, name, critical, future in assets["pending"])
+
+def stop_loading_assets():
+    # Drop queued jobs on exit, a job already running is left to finish
+    if assets["executor"] is not None:
+        assets["executor"].shutdown(wait=False, cancel_futures=True)
+        assets["executor"] = None
+    assets["pending"] = []
+
+def load_resources():
+    # Blocking load of everything, used by the command line tools
+    start_loading_assets()
+    poll_assets(wait=True)
+
+def assign_level_images():
     level_configs[0]["image"] = res["go_logo"]
     level_configs[1]["image"] = res["docker_logo"]
     level_configs[2]["image"] = res["java_logo"]
 
+def draw_loading_screen(done, total):
+    screen.fill(BLACK)
+    label = render_text(res["PENALTY_FONT"], "Loading...", WHITE)
+    bar = pygame.Rect(0, 0, WIDTH // 3, 24)
+    bar.center = (WIDTH // 2, HEIGHT // 2)
+    screen.blit(label, label.get_rect(midbottom=(bar.centerx, bar.top - 12)))
+    pygame.draw.rect(screen, GRAY, bar, 2)
+    fill = bar.inflate(-8, -8)
+    fill.width = int(fill.width * done / max(total, 1))
+    pygame.draw.rect(screen, GREEN, fill)
+    if render["renderer"] is not None:
+        update_texture("overlay_texture", screen).draw()
+        render["renderer"].present()
+    else:
+        pygame.display.flip()
+    render["full_redraw"] = True
+
+async def show_loading_screen():
+    # Keep the window responsive while the critical assets decode, returns False if the player quits
+    clock = pygame.time.Clock()
+    while True:
+        done, total = poll_assets()
+        if assets_ready():
+            return True
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+        draw_loading_screen(done, total)
+        clock.tick(30)
+        await asyncio.sleep(0)
+
 # UI functions
 def create_ui():
     button_width, button_height = 150, 50
@@ -171,21 +589,21 @@ def create_ui():
     ui["final_menu_button"] = {"text": "Back to Menu (Q)", "rect": pygame.Rect(final_start_x + end_button_width + button_spacing, button_y, end_button_width, button_height)}
 
 def draw_button(button, surface):
-    mouse_pos = pygame.mouse.get_pos()
+    mouse_pos = game["input"]["mouse_pos"]
     is_hovered = button["rect"].collidepoint(mouse_pos)
     text_color = LIGHT_YELLOW if is_hovered else WHITE
     
-    pygame.draw.rect(surface, GRAY, button["rect"])
-    text = res["PENALTY_FONT"].render(button["text"], True, text_color)
+    mark_dirty(pygame.draw.rect(surface, GRAY, button["rect"]))
+    text = render_text(res["PENALTY_FONT"], button["text"], text_color)
     surface.blit(text, text.get_rect(center=button["rect"].center))
 
 def draw_slider(slider, surface):
-    pygame.draw.rect(surface, WHITE, slider["rect"], 2)
+    mark_dirty(pygame.draw.rect(surface, WHITE, slider["rect"], 2))
     pygame.draw.rect(surface, GRAY, slider["rect"], 1, 1)
     knob_x = slider["rect"].x + int(slider["value"] * slider["rect"].width)
-    pygame.draw.circle(surface, WHITE, (knob_x, slider["rect"].centery), slider["knob_radius"])
-    volume_text = res["PENALTY_FONT"].render(f"Volume: {int(slider['value'] * 100)}%", True, WHITE)
-    surface.blit(volume_text, (slider["rect"].x, slider["rect"].y - 27))  
+    mark_dirty(pygame.draw.circle(surface, WHITE, (knob_x, slider["rect"].centery), slider["knob_radius"]))
+    volume_text = render_text(res["PENALTY_FONT"], f"Volume: {int(slider['value'] * 100)}%", WHITE)
+    mark_dirty(surface.blit(volume_text, (slider["rect"].x, slider["rect"].y - 27)))
 
 def update_slider(slider, mouse_pos, mouse_pressed):
     if mouse_pressed[0] and slider["rect"].collidepoint(mouse_pos):
@@ -193,253 +611,1600 @@ def update_slider(slider, mouse_pos, mouse_pressed):
     if not mouse_pressed[0]:
         slider["dragging"] = False
     if slider["dragging"]:
-        slider["value"] = max(0, min(1, (mouse_pos[0] - slider["rect"].x) / slider["rect"].width))
-        for sound in ["shoot_sound", "collision_sound", "win_sound"]:
-            if res[sound]:
-                res[sound].set_volume(slider["value"])
-        pygame.mixer.music.set_volume(slider["value"])
+        value = max(0, min(1, (mouse_pos[0] - slider["rect"].x) / slider["rect"].width))
+        if value != slider["value"]:
+            slider["value"] = value
+            set_master_volume(value)
+
+# Audio functions
+def init_audio(channels=AUDIO_CHANNELS):
+    # A fixed pool of channels managed here, pygame never picks one on its own
+    pygame.mixer.set_num_channels(channels)
+    sounds["channels"] = [pygame.mixer.Channel(index) for index in range(channels)]
+    sounds["voices"] = [None] * channels
+
+def play_sound(name):
+    # Called from the simulation, only counts the request. Identical requests in one frame become one voice
+    if sounds["channels"]:
+        sounds["queue"][name] = sounds["queue"].get(name, 0) + 1
+
+def find_channel(name, category):
+    # A free channel unless the category is at its voice limit, then its oldest voice,
+    # then the oldest voice of a lower or equal priority category
+    channels, voices = sounds["channels"], sounds["voices"]
+    busy = [index for index, channel in enumerate(channels) if channel.get_busy()]
+    own = [index for index in busy if voices[index][0] == name]
+    if len(own) >= category["voices"]:
+        return min(own, key=lambda index: voices[index][2])
+    for index in range(len(channels)):
+        if index not in busy:
+            return index
+    stealable = [index for index in busy if voices[index][1] <= category["priority"]]
+    return min(stealable, key=lambda index: voices[index][2]) if stealable else None
+
+def flush_sounds():
+    # Start this frame's sounds, highest priority first so they get the channels
+    queue = sounds["queue"]
+    if not queue:
+        return
+    now = time.perf_counter()
+    for name in sorted(queue, key=lambda name: -SOUND_CATEGORIES[name]["priority"]):
+        sound = res[name]
+        if sound is None or now - sounds["last_played"].get(name, -SOUND_COALESCE_TIME) < SOUND_COALESCE_TIME:
+            continue
+        category = SOUND_CATEGORIES[name]
+        index = find_channel(name, category)
+        if index is None:
+            continue
+        channel = sounds["channels"][index]
+        channel.play(sound)
+        channel.set_volume(sounds["master"] * category["volume"])
+        sounds["voices"][index] = (name, category["priority"], now)
+        sounds["last_played"][name] = now
+    queue.clear()
+
+def set_master_volume(value):
+    # One gain for music and every voice, sounds themselves keep their volume
+    sounds["master"] = value
+    if not pygame.mixer.get_init():
+        return
+    pygame.mixer.music.set_volume(value)
+    for channel, voice in zip(sounds["channels"], sounds["voices"]):
+        if voice is not None:
+            channel.set_volume(value * SOUND_CATEGORIES[voice[0]]["volume"])
+
+# Entity types
+class Tank:
+    __slots__ = ("body_image", "turret_image", "original_body_image", "body_rect", "pos", "prev_pos",
+                 "angle", "speed", "rotation_speed", "max_speed", "turret_angle")
+
+class Bullet:
+    __slots__ = ("pos", "prev_pos", "vel", "image", "rect", "spawn_time", "angle")
+
+    def __init__(self):
+        self.pos = pygame.math.Vector2()
+        self.prev_pos = pygame.math.Vector2()
+        self.vel = pygame.math.Vector2()
+        self.image = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.spawn_time = 0.0
+        self.angle = 0.0
+
+class TargetStore:
+    # Struct-of-arrays holding every target of a level, rows stay in spawn order so ids stay sorted
+    __slots__ = ("ids", "pos", "prev_pos", "vel", "size", "images", "bounds", "bounds_stale", "next_id")
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.uint32)
+        self.next_id = 0
+        self.pos = np.empty((0, 2))
+        self.prev_pos = np.empty((0, 2))
+        self.vel = np.empty((0, 2))
+        self.size = np.empty((0, 2), dtype=np.intp)
+        self.images = []
+        self.bounds = np.empty((0, 4), dtype=np.intp)
+        self.bounds_stale = False
+
+    def __len__(self):
+        return len(self.images)
+
+    def extend(self, pos, vel, images):
+        sizes = np.array([image.get_size() for image in images], dtype=np.intp).reshape(-1, 2)
+        self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + len(sizes), dtype=np.uint32)))
+        self.next_id += len(sizes)
+        self.pos = np.concatenate((self.pos, pos))
+        self.prev_pos = np.concatenate((self.prev_pos, pos))
+        self.vel = np.concatenate((self.vel, vel))
+        self.size = np.concatenate((self.size, sizes))
+        self.images = self.images + list(images)
+        self.bounds_stale = True
+
+    def fill(self, pos, vel, image):
+        # Replace every row with copies of the given arrays sharing one image, the source can be filled from again
+        count = len(pos)
+        self.ids = np.arange(count, dtype=np.uint32)
+        self.next_id = count
+        self.pos = pos.copy()
+        self.prev_pos = pos.copy()
+        self.vel = vel.copy()
+        self.size = np.tile(np.array(image.get_size(), dtype=np.intp), (count, 1))
+        self.images = [image] * count
+        self.bounds_stale = True
+
+    def keep(self, mask):
+        self.ids, self.pos, self.prev_pos, self.vel, self.size = self.ids[mask], self.pos[mask], self.prev_pos[mask], self.vel[mask], self.size[mask]
+        self.images = [image for image, kept in zip(self.images, mask) if kept]
+        self.bounds_stale = True
+
+class Particles:
+    # Struct-of-arrays emitter, the public arrays are views into buffers reused across effects
+    __slots__ = ("pos", "vel", "size", "alpha", "color", "palette", "buffers")
+
+    def __init__(self, capacity=PARTICLE_POOL_CAPACITY):
+        self.buffers = (np.empty((capacity, 2)), np.empty((capacity, 2)), np.empty(capacity), np.empty(capacity),
+                        np.empty(capacity, dtype=np.intp))
+        self.palette = ()
+        self.resize(0)
+
+    def resize(self, count):
+        if count > len(self.buffers[2]):
+            self.buffers = (np.empty((count, 2)), np.empty((count, 2)), np.empty(count), np.empty(count),
+                            np.empty(count, dtype=np.intp))
+        self.pos, self.vel, self.size, self.alpha, self.color = (buffer[:count] for buffer in self.buffers)
+
+class Starburst:
+    __slots__ = ("text", "x", "y", "start_time", "duration", "particles", "is_celebration")
+
+class CollisionEffect:
+    __slots__ = ("pos", "start_time", "duration", "particles", "scorched")
+
+    def __init__(self):
+        self.pos = pygame.math.Vector2()
+        self.start_time = 0.0
+        self.duration = 0.0
+        self.particles = None
+        self.scorched = False
+
+class Pool:
+    # Free list of preallocated instances, reused instead of allocating per spawn
+    __slots__ = ("factory", "free")
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.free = [factory() for _ in range(size)]
+
+    def acquire(self):
+        return self.free.pop() if self.free else self.factory()
+
+    def release(self, item):
+        self.free.append(item)
+
+pools = {
+    "bullets": Pool(Bullet, 64),
+    "collision_effects": Pool(CollisionEffect, 32),
+    "particles": Pool(Particles, 64)
+}
 
 # Game entity functions
 def create_tank(x, y):
-    return {
-        "body_image": res["tank_body_image"],
-        "turret_image": res["tank_turret_image"],
-        "original_body_image": res["tank_body_image"],
-        "body_rect": res["tank_body_image"].get_rect(center=(x, y)),
-        "pos": pygame.math.Vector2(x, y),
-        "angle": 0,
-        "speed": 0,
-        "rotation_speed": 0,
-        "max_speed": TANK_SPEED,
-        "turret_angle": 0,
-        "prev_positions": []
-    }
+    tank = Tank()
+    tank.body_image = res["tank_body_image"]
+    tank.turret_image = res["tank_turret_image"]
+    tank.original_body_image = res["tank_body_image"]
+    tank.body_rect = res["tank_body_image"].get_rect(center=(x, y))
+    tank.pos = pygame.math.Vector2(x, y)
+    tank.prev_pos = pygame.math.Vector2(x, y)
+    tank.angle = 0
+    tank.speed = 0
+    tank.rotation_speed = 0
+    tank.max_speed = TANK_SPEED
+    tank.turret_angle = 0
+    return tank
 
 def update_tank(tank, keys, mouse_pos):
-    # Speed and rotation control
-    tank["speed"] = tank["max_speed"] if keys[pygame.K_w] or keys[pygame.K_UP] else (-tank["max_speed"] * 0.7 if keys[pygame.K_s] or keys[pygame.K_DOWN] else 0)
-    tank["rotation_speed"] = 2 if keys[pygame.K_a] or keys[pygame.K_LEFT] else (-2 if keys[pygame.K_d] or keys[pygame.K_RIGHT] else 0)
+    # Speed and rotation control, both per second
+    tank.speed = tank.max_speed if keys[pygame.K_w] or keys[pygame.K_UP] else (-tank.max_speed * 0.7 if keys[pygame.K_s] or keys[pygame.K_DOWN] else 0)
+    tank.rotation_speed = TANK_ROTATION_SPEED if keys[pygame.K_a] or keys[pygame.K_LEFT] else (-TANK_ROTATION_SPEED if keys[pygame.K_d] or keys[pygame.K_RIGHT] else 0)
     
     # Update angle and position
-    tank["angle"] = (tank["angle"] + tank["rotation_speed"]) % 360
-    angle_rad = math.radians(tank["angle"])
-    tank["pos"].x += math.cos(angle_rad) * tank["speed"]
-    tank["pos"].y -= math.sin(angle_rad) * tank["speed"]
-    tank["pos"].x = max(0, min(tank["pos"].x, WIDTH))
-    tank["pos"].y = max(0, min(tank["pos"].y, HEIGHT))
-    
-    # Track positions and update images
-    tank["prev_positions"].append((tank["pos"].x, tank["pos"].y))
-    if len(tank["prev_positions"]) > 50:
-        tank["prev_positions"].pop(0)
-    
-    tank["body_image"] = pygame.transform.rotate(tank["original_body_image"], tank["angle"])
-    tank["body_rect"] = tank["body_image"].get_rect(center=tank["pos"])
-    tank["turret_angle"] = math.atan2(mouse_pos[1] - tank["pos"].y, mouse_pos[0] - tank["pos"].x)
-
-def draw_tank(tank, surface):
-    # Draw tracks
-    for i in range(1, len(tank["prev_positions"])):
-        pygame.draw.line(surface, (100, 100, 100), tank["prev_positions"][i-1], tank["prev_positions"][i], 2)
-    
-    # Draw tank body and turret
-    surface.blit(tank["body_image"], tank["body_rect"])
-    rotated_turret = pygame.transform.rotate(tank["turret_image"], -math.degrees(tank["turret_angle"]))
-    surface.blit(rotated_turret, rotated_turret.get_rect(center=tank["body_rect"].center))
+    tank.prev_pos.update(tank.pos)
+    tank.angle = (tank.angle + tank.rotation_speed * SIM_DT) % 360
+    angle_rad = math.radians(tank.angle)
+    tank.pos.x += math.cos(angle_rad) * tank.speed * SIM_DT
+    tank.pos.y -= math.sin(angle_rad) * tank.speed * SIM_DT
+    tank.pos.x = max(0, min(tank.pos.x, WIDTH))
+    tank.pos.y = max(0, min(tank.pos.y, HEIGHT))
+    
+    # Update images
+    tank.body_image = get_rotated(tank.original_body_image, tank.angle)
+    tank.body_rect = tank.body_image.get_rect(center=tank.pos)
+    tank.turret_angle = math.atan2(mouse_pos[1] - tank.pos.y, mouse_pos[0] - tank.pos.x)
+
+def draw_tank(tank, surface, alpha=1.0):
+    # Tracks live on the decal layer, draw tank body and turret
+    center = to_view(interpolate(tank, alpha))
+    body_image = tank.body_image if render["scale"] == 1 else get_rotated(view_image(tank.original_body_image), tank.angle)
+    mark_dirty(surface.blit(body_image, body_image.get_rect(center=center)))
+    rotated_turret = get_rotated(view_image(tank.turret_image), -math.degrees(tank.turret_angle))
+    mark_dirty(surface.blit(rotated_turret, rotated_turret.get_rect(center=center)))
 
 def shoot_tank(tank):
     # Create bullet
-    bullet = {
-        "pos": pygame.math.Vector2(tank["pos"].x, tank["pos"].y),
-        "vel": pygame.math.Vector2(BULLET_SPEED * math.cos(tank["turret_angle"]), BULLET_SPEED * math.sin(tank["turret_angle"])),
-        "image": res["bullet_image"],
-        "rect": res["bullet_image"].get_rect(center=(tank["pos"].x, tank["pos"].y)),
-        "spawn_time": pygame.time.get_ticks() / 1000,
-        "angle": math.degrees(tank["turret_angle"])
-    }
+    bullet = pools["bullets"].acquire()
+    bullet.pos.update(tank.pos)
+    bullet.prev_pos.update(tank.pos)
+    bullet.vel.update(BULLET_SPEED * math.cos(tank.turret_angle), BULLET_SPEED * math.sin(tank.turret_angle))
+    bullet.image = res["bullet_image"]
+    bullet.rect.size = bullet.image.get_size()
+    bullet.rect.center = tank.pos
+    bullet.spawn_time = game["time"]
+    bullet.angle = math.degrees(tank.turret_angle)
     
     # Play sound
-    if res["shoot_sound"]:
-        res["shoot_sound"].play()
+    play_sound("shoot_sound")
     
-    # Apply recoil
-    recoil_angle = tank["turret_angle"] + math.pi
-    tank["pos"].x += math.cos(recoil_angle) * 5
-    tank["pos"].y += math.sin(recoil_angle) * 5
-    tank["pos"].x = max(0, min(tank["pos"].x, WIDTH))
-    tank["pos"].y = max(0, min(tank["pos"].y, HEIGHT))
-    tank["body_rect"].center = tank["pos"]
+    # Apply recoil, prev_pos moves along so the kick is not interpolated as tick movement
+    recoil_angle = tank.turret_angle + math.pi
+    start = pygame.math.Vector2(tank.pos)
+    tank.pos.x += math.cos(recoil_angle) * TANK_RECOIL
+    tank.pos.y += math.sin(recoil_angle) * TANK_RECOIL
+    tank.pos.x = max(0, min(tank.pos.x, WIDTH))
+    tank.pos.y = max(0, min(tank.pos.y, HEIGHT))
+    tank.prev_pos += tank.pos - start
+    tank.body_rect.center = tank.pos
     
     return bullet
 
 def update_bullet(bullet):
-    bullet["pos"] += bullet["vel"]
-    bullet["rect"].center = bullet["pos"]
-    return (0 <= bullet["pos"].x <= WIDTH and 0 <= bullet["pos"].y <= HEIGHT and
-            (pygame.time.get_ticks() / 1000 - bullet["spawn_time"]) < BULLET_LIFETIME)
+    bullet.prev_pos.update(bullet.pos)
+    bullet.pos += bullet.vel * SIM_DT
+    bullet.rect.center = bullet.pos
+    return (0 <= bullet.pos.x <= WIDTH and 0 <= bullet.pos.y <= HEIGHT and
+            (game["time"] - bullet.spawn_time) < BULLET_LIFETIME)
 
-def draw_bullet(bullet, surface):
-    rotated_bullet = pygame.transform.rotate(bullet["image"], -bullet["angle"])
-    surface.blit(rotated_bullet, rotated_bullet.get_rect(center=bullet["pos"]))
+def draw_bullet(bullet, surface, alpha=1.0):
+    rotated_bullet = get_rotated(view_image(bullet.image), -bullet.angle)
+    mark_dirty(surface.blit(rotated_bullet, rotated_bullet.get_rect(center=to_view(interpolate(bullet, alpha)))))
 
-def create_target(x, y, image):
-    return {
-        "image": image,
-        "rect": image.get_rect(center=(x, y)),
-        "pos": pygame.math.Vector2(x, y),
-        "vel": pygame.math.Vector2(random.uniform(-TARGET_SPEED, TARGET_SPEED), random.uniform(-TARGET_SPEED, TARGET_SPEED))
-    }
+def spawn_positions(count, rng):
+    return np.column_stack((rng.integers(50, WIDTH - 50, count, endpoint=True),
+                            rng.integers(50, HEIGHT - 50, count, endpoint=True))).astype(float)
 
-def update_target(target):
-    # Update position
-    target["pos"] += target["vel"]
-    
-    # Bounce off walls
-    if target["pos"].x < 0 or target["pos"].x > WIDTH:
-        target["vel"].x *= -1
-    if target["pos"].y < 0 or target["pos"].y > HEIGHT:
-        target["vel"].y *= -1
+def spawn_values(count, rng, clear_of=None):
+    # Positions and velocities for count targets from a numpy generator, drawn in one go so huge levels stay cheap.
+    # Positions within SPAWN_SAFE_RADIUS of clear_of are drawn again, so no target starts on the tank
+    pos = spawn_positions(count, rng)
+    if clear_of is not None:
+        close = np.hypot(*(pos - clear_of).T) < SPAWN_SAFE_RADIUS
+        while close.any():
+            pos[close] = spawn_positions(int(close.sum()), rng)
+            close = np.hypot(*(pos - clear_of).T) < SPAWN_SAFE_RADIUS
+    vel = rng.uniform(-TARGET_SPEED, TARGET_SPEED, (count, 2))
+    return pos, vel
+
+def create_targets(count, image):
+    # Seeded off the global RNG so a seed always spawns the same targets
+    pos, vel = spawn_values(count, np.random.default_rng(random.getrandbits(64)))
+    targets = TargetStore()
+    targets.fill(pos, vel, image)
+    return targets
+
+def update_targets(targets):
+    # Move, bounce off walls and clamp every target at once
+    np.copyto(targets.prev_pos, targets.pos)
+    targets.pos += targets.vel * SIM_DT
+    limits = (WIDTH, HEIGHT)
+    targets.vel[(targets.pos < 0) | (targets.pos > limits)] *= -1
+    np.clip(targets.pos, 0, limits, out=targets.pos)
+    targets.bounds_stale = True
+
+def round_center(center):
+    # pygame.Rect rounds a float center half away from zero
+    return np.trunc(center + np.copysign(0.5, center)).astype(np.intp)
+
+def target_bounds(targets):
+    # Left, top, right, bottom per target, recomputed only after the targets moved
+    if targets.bounds_stale:
+        topleft = round_center(targets.pos) - targets.size // 2
+        targets.bounds = np.concatenate((topleft, topleft + targets.size), axis=1)
+        targets.bounds_stale = False
+    return targets.bounds
+
+def bounds_overlap(bounds, rect):
+    # Vectorized Rect.colliderect against rows of left, top, right, bottom
+    return (bounds[:, 0] < rect.right) & (bounds[:, 2] > rect.left) & (bounds[:, 1] < rect.bottom) & (bounds[:, 3] > rect.top)
+
+def draw_targets(targets, surface, alpha=1.0):
+    # Interpolate all centers in one step, then hand every blit to SDL in one call
+    if not len(targets):
+        return
+    center = targets.prev_pos + (targets.pos - targets.prev_pos) * alpha
+    if render["scale"] == 1:
+        topleft = (round_center(center) - targets.size // 2).tolist()
+        render["dirty_rects"].extend(surface.blits(zip(targets.images, topleft)))
+        return
+    images = [view_image(image) for image in targets.images]
+    size = np.array([image.get_size() for image in images], dtype=np.intp)
+    topleft = (round_center(center * render["scale"]) - size // 2).tolist()
+    render["dirty_rects"].extend(surface.blits(zip(images, topleft)))
+
+def interpolate(entity, alpha):
+    # Blend between the last two simulation ticks for smooth drawing at any frame rate
+    return entity.prev_pos.lerp(entity.pos, alpha)
+
+def release_bullets(bullets):
+    for bullet in bullets:
+        pools["bullets"].release(bullet)
+
+def release_effects(effects):
+    for effect in effects:
+        pools["particles"].release(effect.particles)
+        effect.particles = None
+        pools["collision_effects"].release(effect)
+
+def release_animations(animations):
+    for animation in animations:
+        pools["particles"].release(animation.particles)
+        animation.particles = None
+
+# Particle functions
+def create_particles(x, y, count, speed_range, size_range, palette):
+    # Filled in place from an RNG seeded off the global one so random.seed() still reproduces effects
+    rng = np.random.default_rng(random.getrandbits(64))
+    particles = pools["particles"].acquire()
+    particles.resize(count)
+    particles.palette = palette
     
-    # Clamp position
-    target["pos"].x = max(0, min(target["pos"].x, WIDTH))
-    target["pos"].y = max(0, min(target["pos"].y, HEIGHT))
-    target["rect"].center = target["pos"]
+    angles = rng.random(count) * (2 * math.pi)
+    speeds = speed_range[0] + rng.random(count) * (speed_range[1] - speed_range[0])
+    particles.pos[:] = (x, y)
+    np.multiply(np.cos(angles), speeds, out=particles.vel[:, 0])
+    np.multiply(np.sin(angles), speeds, out=particles.vel[:, 1])
+    particles.size[:] = rng.integers(size_range[0], size_range[1] + 1, count)
+    particles.alpha.fill(255.0)
+    particles.color[:] = rng.integers(0, len(palette), count)
+    return particles
+
+def get_particle_atlas(palette):
+    # Pre-rendered circles indexed by [radius, color index, alpha level]
+    atlas = render["particle_atlases"].get(palette)
+    if atlas is None:
+        atlas = np.empty((PARTICLE_MAX_SIZE + 1, len(palette), PARTICLE_ALPHA_LEVELS), dtype=object)
+        for radius in range(PARTICLE_MAX_SIZE + 1):
+            for color_index, color in enumerate(palette):
+                for level in range(PARTICLE_ALPHA_LEVELS):
+                    sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+                    alpha = level * 255 // (PARTICLE_ALPHA_LEVELS - 1)
+                    pygame.draw.circle(sprite, (*color, alpha), (radius, radius), radius)
+                    atlas[radius, color_index, level] = sprite
+        render["particle_atlases"][palette] = atlas
+    return atlas
+
+def draw_particles(particles, surface):
+    scale = render["scale"]
+    radius = np.clip((particles.size * scale).astype(int), 1, PARTICLE_MAX_SIZE)
+    level = np.rint(particles.alpha * ((PARTICLE_ALPHA_LEVELS - 1) / 255)).astype(int)
+    visible = level > 0
+    if not visible.any():
+        return
+    radius, level = radius[visible], level[visible]
+    sprites = get_particle_atlas(particles.palette)[radius, particles.color[visible], level]
+    topleft = particles.pos[visible] * scale - radius[:, None]
+    mark_dirty_union(surface.blits(zip(sprites, topleft.tolist())))
 
 # Animation functions
 def create_starburst_animation(text, x, y, duration=2.0, particle_count=60, is_celebration=False):
-    particles = []
-    colors = [RED, VIOLET, GREEN, YELLOW] if is_celebration else [YELLOW]
-    
-    for _ in range(particle_count):
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(100, 300) if is_celebration else random.uniform(100, 200)
-        particles.append({
-            'pos': pygame.math.Vector2(x, y),
-            'vel': pygame.math.Vector2(math.cos(angle) * speed, math.sin(angle) * speed),
-            'size': random.randint(5, 10),
-            'alpha': 255,
-            'color': random.choice(colors) if is_celebration else YELLOW
-        })
+    speed_range = (100, 300) if is_celebration else (100, 200)
+    palette = CELEBRATION_COLORS if is_celebration else (YELLOW,)
     
-    return {
-        "text": text,
-        "x": x,
-        "y": y,
-        "start_time": pygame.time.get_ticks() / 1000,
-        "duration": duration,
-        "particles": particles,
-        "is_celebration": is_celebration
-    }
+    animation = Starburst()
+    animation.text = text
+    animation.x = x
+    animation.y = y
+    animation.start_time = game["time"]
+    animation.duration = duration
+    animation.particles = create_particles(x, y, scale_particles(particle_count), speed_range, (5, 10), palette)
+    animation.is_celebration = is_celebration
+    return animation
 
 def update_starburst_animation(animation):
-    elapsed = pygame.time.get_ticks() / 1000 - animation["start_time"]
-    if elapsed > animation["duration"]:
+    elapsed = game["time"] - animation.start_time
+    if elapsed > animation.duration:
         return False
     
-    progress = elapsed / animation["duration"]
-    for particle in animation["particles"]:
-        particle['pos'] += particle['vel'] * (1 / FPS)
-        particle['alpha'] = int(255 * (1 - progress))
-        particle['size'] = max(1, particle['size'] * (1 - progress))
+    progress = elapsed / animation.duration
+    particles = animation.particles
+    particles.pos += particles.vel * SIM_DT
+    particles.alpha.fill(int(255 * (1 - progress)))
+    np.maximum(particles.size * (1 - progress), 1, out=particles.size)
     return True
 
 def draw_starburst_animation(animation, surface):
-    text = res["FONT"].render(animation["text"], True, WHITE)
-    surface.blit(text, text.get_rect(center=(animation["x"], animation["y"])))
-    
-    for particle in animation["particles"]:
-        particle_surface = pygame.Surface((particle['size'] * 2, particle['size'] * 2), pygame.SRCALPHA)
-        pygame.draw.circle(particle_surface, (*particle['color'], particle['alpha']),
-                          (particle['size'], particle['size']), particle['size'])
-        surface.blit(particle_surface, (particle['pos'].x - particle['size'], particle['pos'].y - particle['size']))
+    draw_particles(animation.particles, surface)
+
+def draw_starburst_text(animation, surface):
+    text = render_text(res["FONT"], animation.text, WHITE)
+    mark_dirty(surface.blit(text, text.get_rect(center=(animation.x, animation.y))))
 
 def create_collision_effect(x, y):
-    particles = []
-    for _ in range(25):
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(50, 150)
-        particles.append({
-            'pos': pygame.math.Vector2(x, y),
-            'vel': pygame.math.Vector2(math.cos(angle) * speed, math.sin(angle) * speed),
-            'size': random.randint(6, 12),
-            'color': (255, random.randint(0, 100), 0),
-            'alpha': 255
-        })
-    
-    return {
-        "pos": pygame.math.Vector2(x, y),
-        "start_time": pygame.time.get_ticks() / 1000,
-        "duration": 1.5,
-        "particles": particles
-    }
+    effect = pools["collision_effects"].acquire()
+    effect.pos.update(x, y)
+    effect.start_time = game["time"]
+    effect.duration = 1.5
+    effect.particles = create_particles(x, y, scale_particles(COLLISION_PARTICLES), (100, 300), (6, 12), SPARK_COLORS)
+    effect.scorched = False
+    return effect
 
 def update_collision_effect(effect):
-    elapsed = pygame.time.get_ticks() / 1000 - effect["start_time"]
-    if elapsed > effect["duration"]:
+    elapsed = game["time"] - effect.start_time
+    if elapsed > effect.duration:
         return False
 
-    progress = elapsed / effect["duration"]
-    for particle in effect["particles"]:
-        particle['pos'] += particle['vel'] * (1 / 60)
-        particle['vel'] *= 0.92
-        particle['size'] = max(1, particle['size'] * 0.95)
-        particle['alpha'] = int(255 * (1 - progress))
+    progress = elapsed / effect.duration
+    particles = effect.particles
+    particles.pos += particles.vel * SIM_DT
+    particles.vel *= PARTICLE_DRAG ** (SIM_DT * 60)
+    np.maximum(particles.size * PARTICLE_SHRINK ** (SIM_DT * 60), 1, out=particles.size)
+    particles.alpha.fill(int(255 * (1 - progress)))
     return True
 
 def draw_collision_effect(effect, surface):
-    for particle in effect["particles"]:
-        if particle['alpha'] > 0:
-            particle_surface = pygame.Surface((particle['size'] * 2, particle['size'] * 2), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, (*particle['color'], particle['alpha']),
-                              (particle['size'], particle['size']), particle['size'])
-            surface.blit(particle_surface, (particle['pos'].x - particle['size'], particle['pos'].y - particle['size']))
+    draw_particles(effect.particles, surface)
+
+# Collision functions
+def rect_bounds(rects):
+    return np.array([(rect.left, rect.top, rect.right, rect.bottom) for rect in rects], dtype=np.intp).reshape(-1, 4)
+
+def cell_key(cell_x, cell_y):
+    return (cell_x + CELL_KEY_OFFSET) * CELL_KEY_STRIDE + cell_y + CELL_KEY_OFFSET
+
+def build_spatial_hash(bounds, cell_size=COLLISION_CELL_SIZE):
+    # Uniform grid over rows of left, top, right, bottom, stored as (cell key, index) pairs sorted by key
+    first = bounds[:, :2] // cell_size
+    span = (bounds[:, 2:] - 1) // cell_size - first
+    index = np.arange(len(bounds))
+    keys, indices = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.intp)]
+    for dx in range(int(span[:, 0].max(initial=-1)) + 1):
+        for dy in range(int(span[:, 1].max(initial=-1)) + 1):
+            inside = (span[:, 0] >= dx) & (span[:, 1] >= dy)
+            keys.append(cell_key(first[inside, 0] + dx, first[inside, 1] + dy))
+            indices.append(index[inside])
+    keys, indices = np.concatenate(keys), np.concatenate(indices)
+    order = np.argsort(keys, kind="stable")
+    return keys[order], indices[order]
+
+def overlapping_pairs(bounds, queries, grid=None, cell_size=COLLISION_CELL_SIZE):
+    # (query, target) index pairs whose boxes overlap, ordered by query and then target.
+    # Without a grid every pair is tested, otherwise only pairs sharing a cell
+    if grid is None:
+        query, target = np.nonzero((queries[:, None, 0] < bounds[None, :, 2]) & (queries[:, None, 2] > bounds[None, :, 0]) &
+                                   (queries[:, None, 1] < bounds[None, :, 3]) & (queries[:, None, 3] > bounds[None, :, 1]))
+        return query, target
+    
+    # Look up every cell the queries touch, then expand the matching key ranges into pairs
+    query_keys, query_index = build_spatial_hash(queries, cell_size)
+    keys, indices = grid
+    starts = np.searchsorted(keys, query_keys)
+    counts = np.searchsorted(keys, query_keys, side="right") - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pairs = np.unique(np.repeat(query_index, counts) * len(bounds) + indices[np.repeat(starts, counts) + offsets])
+    query, target = pairs // len(bounds), pairs % len(bounds)
+    overlap = ((queries[query, 0] < bounds[target, 2]) & (queries[query, 2] > bounds[target, 0]) &
+               (queries[query, 1] < bounds[target, 3]) & (queries[query, 3] > bounds[target, 1]))
+    return query[overlap], target[overlap]
+
+def collision_grid(bounds):
+    # Small levels skip the grid, testing every pair is cheaper
+    return build_spatial_hash(bounds) if len(bounds) >= SPATIAL_HASH_MIN_TARGETS else None
+
+def tank_hits_target(tank, bounds, grid):
+    return len(overlapping_pairs(bounds, rect_bounds([tank.body_rect]), grid)[0]) > 0
+
+def swept_bounds(bounds, motion, reach=(0, 0)):
+    # Boxes covering rows of left, top, right, bottom over a tick in which they moved by motion, grown by reach
+    start = bounds - np.tile(motion, 2)
+    low = np.floor(np.minimum(bounds[:, :2], start[:, :2]) - reach)
+    high = np.ceil(np.maximum(bounds[:, 2:], start[:, 2:]) + reach)
+    return np.concatenate((low, high), axis=1).astype(np.intp)
+
+def sweep_times(moving, bounds, motion):
+    # Earliest point of the tick, 0 to 1, at which each moving box overlaps the matching box, NaN if it never does.
+    # moving is where the box ended the tick after moving by motion relative to the other one. Per axis the
+    # overlap holds for s = 1 - time in an open interval, the slabs are intersected with [0, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = (moving[:, :2] - bounds[:, 2:]) / motion
+        b = (moving[:, 2:] - bounds[:, :2]) / motion
+    low = np.minimum(a, b).max(axis=1)
+    high = np.maximum(a, b).min(axis=1)
+    return np.where((low < high) & (low < 1) & (high > 0), 1 - np.minimum(high, 1), np.nan)
+
+def find_bullet_hits(bullets, bounds, grid, motion=None):
+    # (bullet, target) index pairs in the order they happen within the tick. Each bullet is swept from its previous
+    # position against the targets moving by motion, so a fast bullet cannot pass through a target between ticks,
+    # and hits the first target on its path that no earlier hit took
+    if not bullets or not len(bounds):
+        return []
+    motion = np.zeros((len(bounds), 2)) if motion is None else motion
+    rects = rect_bounds(bullet.rect for bullet in bullets)
+    bullet_motion = np.array([(bullet.pos.x - bullet.prev_pos.x, bullet.pos.y - bullet.prev_pos.y) for bullet in bullets])
+    queries = swept_bounds(rects, bullet_motion, np.abs(motion).max(axis=0))
+    bullet_index, target_index = overlapping_pairs(bounds, queries, grid)
+    times = sweep_times(rects[bullet_index], bounds[target_index], bullet_motion[bullet_index] - motion[target_index])
+    hit = ~np.isnan(times)
+    bullet_index, target_index, times = bullet_index[hit], target_index[hit], times[hit]
+    order = np.lexsort((target_index, bullet_index, times))
+    
+    hit_targets, hit_bullets, hits = set(), set(), []
+    for bullet_index, target_index in zip(bullet_index[order].tolist(), target_index[order].tolist()):
+        if bullet_index not in hit_bullets and target_index not in hit_targets:
+            hit_targets.add(target_index)
+            hit_bullets.add(bullet_index)
+            hits.append((bullet_index, target_index))
+    return hits
+
+def remove_hits(hits, spent=()):
+    # Remove hit targets, and hit and spent bullets, in one pass
+    if hits:
+        keep = np.ones(len(game["targets"]), dtype=bool)
+        keep[[target_index for bullet_index, target_index in hits]] = False
+        game["targets"].keep(keep)
+    removed = {bullet_index for bullet_index, target_index in hits}.union(spent)
+    if removed:
+        bullets = game["bullets"]
+        game["bullets"] = [bullet for index, bullet in enumerate(bullets) if index not in removed]
+        release_bullets(bullets[index] for index in removed)
+
+# Video stream functions
+def list_video_frames():
+    if not os.path.exists(VIDEO_FRAMES_DIR):
+        return []
+    try:
+        frame_files = sorted([f for f in os.listdir(VIDEO_FRAMES_DIR) if f.endswith('.png')])
+    except OSError as e:
+        print(f"Video frame loading error: {e}")
+        return []
+    return [os.path.join(VIDEO_FRAMES_DIR, frame_file) for frame_file in frame_files]
+
+def frame_cache_fingerprint(files):
+    # Changes whenever a source PNG is added, removed or modified, or the frame size changes
+    digest = hashlib.sha256(f"{WIDTH}x{HEIGHT}".encode())
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.digest()
+
+def frame_cache_compatible():
+    # Frames are stored as BGRA bytes, which only matches 32-bit XRGB/ARGB displays. Texture uploads convert any layout
+    if render["renderer"] is not None:
+        return True
+    display = pygame.display.get_surface()
+    return display is not None and display.get_bitsize() == 32 and display.get_masks()[:3] == (0xFF0000, 0xFF00, 0xFF)
+
+def build_frame_cache(files, path):
+    pitch = WIDTH * 4
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        header = FRAME_CACHE_HEADER.pack(FRAME_CACHE_MAGIC, 1, WIDTH, HEIGHT, pitch, len(files), frame_cache_fingerprint(files))
+        f.write(header.ljust(FRAME_CACHE_ALIGN, b"\0"))
+        for index, frame_file in enumerate(files):
+            frame = pygame.transform.scale(pygame.image.load(frame_file), (WIDTH, HEIGHT))
+            f.write(pygame.image.tobytes(frame, "BGRA"))
+            if (index + 1) % 100 == 0:
+                print(f"Frame cache: {index + 1}/{len(files)} frames")
+    os.replace(temp_path, path)
+
+def read_frame_cache(files, path):
+    # Returns the mapped cache, or None when it is missing or stale
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        cache = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(cache) < FRAME_CACHE_HEADER.size:
+        cache.close()
+        return None
+    magic, version, width, height, pitch, count, fingerprint = FRAME_CACHE_HEADER.unpack_from(cache)
+    if (magic, version, width, height, count) != (FRAME_CACHE_MAGIC, 1, WIDTH, HEIGHT, len(files)) or \
+            fingerprint != frame_cache_fingerprint(files) or len(cache) < FRAME_CACHE_ALIGN + pitch * height * count:
+        cache.close()
+        return None
+    return cache
+
+def open_frame_cache(files, path):
+    if not frame_cache_compatible():
+        return None
+    try:
+        cache = read_frame_cache(files, path)
+        if cache is None:
+            print(f"Building frame cache for {len(files)} frames")
+            build_frame_cache(files, path)
+            cache = read_frame_cache(files, path)
+    except (OSError, ValueError, pygame.error) as e:
+        print(f"Frame cache error: {e}")
+        return None
+    
+    # Each frame is a surface straight over the mapped pages, nothing is copied
+    frame_bytes = WIDTH * 4 * HEIGHT
+    view = memoryview(cache)
+    frames = []
+    for index in range(len(files)):
+        offset = FRAME_CACHE_ALIGN + index * frame_bytes
+        frame = pygame.image.frombuffer(view[offset:offset + frame_bytes], (WIDTH, HEIGHT), "BGRA")
+        frame.set_alpha(None)
+        frames.append(frame)
+    return cache, frames
+
+def decode_video_frame(number):
+    path = video["files"][number % len(video["files"])]
+    try:
+        return pygame.transform.scale(pygame.image.load(path), view_size())
+    except (pygame.error, OSError) as e:
+        print(f"Video frame loading error: {e}")
+        return None
+
+def video_worker():
+    condition = video["condition"]
+    number = video["position"] + 1
+    failures = 0
+    while failures < len(video["files"]):
+        # Wait for room in the ring buffer, then skip frames the playback clock already passed
+        with condition:
+            while video["running"] and len(video["buffer"]) >= video["capacity"]:
+                condition.wait()
+            if not video["running"]:
+                return
+            if number <= video["position"]:
+                video["dropped"] += video["position"] + 1 - number
+                number = video["position"] + 1
+        
+        # Decode outside the lock so the game loop never waits on it
+        frame = decode_video_frame(number)
+        failures = 0 if frame is not None else failures + 1
+        with condition:
+            if frame is not None:
+                video["buffer"].append((number, frame))
+            condition.notify_all()
+        number += video_stride()
+
+def start_video_stream():
+    if not video["files"] or video["worker"] is not None:
+        return
+    if video["frames"]:
+        game["background_frame"] = video["frames"][video["position"] % len(video["frames"])]
+        return
+    game["background_frame"] = decode_video_frame(video["position"])
+    
+    # Emscripten has no threads, update_background_frame decodes inline there
+    if platform.system() == "Emscripten":
+        return
+    
+    frame_bytes = view_size()[0] * view_size()[1] * 4
+    video["capacity"] = max(2, VIDEO_BUFFER_BYTES // frame_bytes)
+    video["running"] = True
+    video["worker"] = threading.Thread(target=video_worker, name="video-stream", daemon=True)
+    video["worker"].start()
+
+def stop_video_stream():
+    if video["worker"] is None:
+        return
+    with video["condition"]:
+        video["running"] = False
+        video["buffer"].clear()
+        video["condition"].notify_all()
+    video["worker"].join()
+    video["worker"] = None
 
 # Game state functions
-def reset_to_menu():
-    game["state"] = "menu"
-    game["level"] = 1
+def new_session(seed):
+    # The simulation only depends on this seed and the input stream
+    random.seed(seed)
+    game["time"] = 0.0
+    reset_to_menu()
+
+def update_bullets(bullets):
+    # Moves every bullet and returns the indices of those that left the screen or ran out of time. They are only
+    # removed with the hits, so a bullet that crosses a target on its way off the screen still hits it
+    return {index for index, bullet in enumerate(bullets) if not update_bullet(bullet)}
+
+def update_collision_effects(effects):
+    alive = []
+    for effect in effects:
+        if update_collision_effect(effect):
+            alive.append(effect)
+        else:
+            release_effects([effect])
+    return alive
+
+def update_animations(animations):
+    alive = []
+    for animation in animations:
+        if update_starburst_animation(animation):
+            alive.append(animation)
+        else:
+            release_animations([animation])
+    return alive
+
+def set_animation(animation):
+    release_animations(game["animations"])
+    game["animations"] = [animation]
+
+def clear_entities():
+    release_bullets(game["bullets"])
+    release_effects(game["collision_effects"])
+    release_animations(game["animations"])
     game["bullets"] = []
-    game["targets"] = []
+    game["targets"] = TargetStore()
     game["collision_effects"] = []
     game["animations"] = []
+
+def change_state(state):
+    # Every state transition goes through here so diagnostics can observe it
+    game["state"] = state
+    if memory["enabled"]:
+        record_memory(state)
+
+def reset_to_menu():
+    game["level"] = 1
+    clear_entities()
     game["bullets_left"] = 0
     game["tank"] = create_tank(WIDTH // 2, HEIGHT // 2)
-    game["current_frame_index"] = 0
-    game["last_frame_time"] = pygame.time.get_ticks() / 1000
+    game["last_frame_time"] = game["time"]
+    clear_decals()
+    
+    # Every return to the menu draws new layouts from the session RNG, only Retry, Replay and Restart repeat one
+    levels["seed"] = random.getrandbits(64)
+    levels["snapshots"] = {}
+    prepare_level(1)
+    change_state("menu")
 
 def update_background_frame():
-    if game["video_frames"]:
-        current_time = pygame.time.get_ticks() / 1000
-        if current_time - game["last_frame_time"] >= 1.0 / VIDEO_FPS:
-            game["current_frame_index"] = (game["current_frame_index"] + 1) % len(game["video_frames"])
-            game["last_frame_time"] = current_time
+    if not video["files"]:
+        return
+    
+    # Number of video frames the playback clock has moved past since the last one shown,
+    # lower quality levels show every second or fourth frame at the same playback speed
+    fps = quality_settings()["video_fps"]
+    due = int((game["time"] - game["last_frame_time"]) * fps)
+    if due < 1:
+        return
+    game["last_frame_time"] += due / fps
+    video["position"] += due * video_stride()
+    
+    # Mapped frames are always ready, without threads decode inline,
+    # otherwise take the newest buffered frame that is due
+    frame = None
+    if video["frames"]:
+        frame = video["frames"][video["position"] % len(video["frames"])]
+    elif video["worker"] is None:
+        frame = decode_video_frame(video["position"])
+    else:
+        with video["condition"]:
+            while video["buffer"] and video["buffer"][0][0] <= video["position"]:
+                if frame is not None:
+                    video["dropped"] += 1
+                number, frame = video["buffer"].popleft()
+            video["condition"].notify_all()
+    
+    # Keep showing the current frame when the decoder has fallen behind
+    if frame is None:
+        video["repeated"] += 1
+        return
+    game["background_frame"] = frame
+    game["current_frame_index"] = video["position"] % len(video["files"])
 
 def start_level():
-    config = level_configs[game["level"] - 1]
-    game["bullets_left"] = config["bullets"]
-    game["targets"] = [create_target(random.randint(50, WIDTH - 50), random.randint(50, HEIGHT - 50), config["image"])
-                      for _ in range(config["targets"])]
+    release_bullets(game["bullets"])
+    release_effects(game["collision_effects"])
     game["bullets"] = []
     game["collision_effects"] = []
-    game["animations"] = [create_starburst_animation(f"Level {game['level']} Starting!", WIDTH // 2, HEIGHT // 2)]
-    game["state"] = "playing"
+    restore_snapshot(level_snapshot(game["level"]))
+    set_animation(create_starburst_animation(f"Level {game['level']} Starting!", WIDTH // 2, HEIGHT // 2))
+    clear_decals()
+    change_state("playing")
+
+def start_game():
+    # Start from the menu, level 1 begins once the intro has played
+    game["level"] = 1
+    set_animation(create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2))
+    change_state("starting")
+
+def restart_game():
+    # Retry, Replay, Restart and R restore level 1's snapshot straight away, without the intro
+    game["level"] = 1
+    start_level()
+
+# Level snapshot functions
+def build_level_snapshot(seed, level, bullets, count):
+    # Runs on the level builder thread, so it only touches its own RNG and never the game state
+    rng = random.Random(f"{seed}/{level}")
+    spawn = (WIDTH // 2, HEIGHT // 2)
+    pos, vel = spawn_values(count, np.random.default_rng(rng.getrandbits(64)), spawn)
+    return {
+        "level": level,
+        "bullets_left": bullets,
+        "tank": (*spawn, 0, 0.0),
+        "target_pos": pos,
+        "target_vel": vel,
+        "rng": rng.getstate()
+    }
+
+def prepare_level(level):
+    # Start building a level's snapshot ahead of time, a level is only built once per visit to the menu
+    if level in levels["snapshots"] or level > len(level_configs):
+        return
+    config = level_configs[level - 1]
+    args = (levels["seed"], level, config["bullets"], config["targets"])
+    if platform.system() == "Emscripten":
+        # No threads, build right away
+        future = Future()
+        future.set_result(build_level_snapshot(*args))
+    else:
+        if levels["executor"] is None:
+            levels["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-builder")
+        future = levels["executor"].submit(build_level_snapshot, *args)
+    levels["snapshots"][level] = future
+
+def level_snapshot(level):
+    # Waits only when the level was not prepared or is still being built
+    prepare_level(level)
+    return levels["snapshots"][level].result()
+
+def restore_snapshot(snapshot):
+    # Entities are refilled from the snapshot's arrays, nothing is re-rolled. Bullets, effects and animations are left to the caller
+    game["level"] = snapshot["level"]
+    game["bullets_left"] = snapshot["bullets_left"]
+    x, y, angle, turret_angle = snapshot["tank"]
+    tank = game["tank"] = create_tank(x, y)
+    tank.angle = angle
+    tank.turret_angle = turret_angle
+    tank.body_image = get_rotated(tank.original_body_image, angle)
+    tank.body_rect = tank.body_image.get_rect(center=tank.pos)
+    game["targets"] = TargetStore()
+    game["targets"].fill(snapshot["target_pos"], snapshot["target_vel"], level_configs[snapshot["level"] - 1]["image"])
+    random.setstate(snapshot["rng"])
+
+# Profiler functions
+def profile_begin():
+    return time.perf_counter() if profiler["enabled"] else 0.0
+
+def profile_end(phase, start):
+    if profiler["enabled"]:
+        index = PROFILE_INDEX[phase]
+        profiler["current"][index] += time.perf_counter() - start
+        if np.isnan(profiler["offsets"][index]):
+            profiler["offsets"][index] = start - profiler["frame_start"]
+
+def profile_frame():
+    # Close the current frame into the ring buffer and start timing the next one
+    now = time.perf_counter()
+    if profiler["enabled"] and profiler["frame_start"]:
+        row = profiler["frames"] % PROFILE_HISTORY
+        profiler["frame_starts"][row] = profiler["frame_start"]
+        profiler["frame_times"][row] = now - profiler["frame_start"]
+        profiler["durations"][row] = profiler["current"]
+        profiler["phase_offsets"][row] = profiler["offsets"]
+        profiler["counts"][row] = (len(game["bullets"]), len(game["targets"]), len(game["collision_effects"]), len(game["animations"]),
+                                   sum(len(item.particles.size) for item in game["collision_effects"] + game["animations"]))
+        profiler["frames"] += 1
+    profiler["current"].fill(0.0)
+    profiler["offsets"].fill(np.nan)
+    profiler["frame_start"] = now
+
+def profile_history():
+    # Rows of the ring buffer in chronological order
+    count = min(profiler["frames"], PROFILE_HISTORY)
+    return np.arange(profiler["frames"] - count, profiler["frames"]) % PROFILE_HISTORY
+
+# Quality governor functions
+def quality_settings():
+    return QUALITY_LEVELS[quality["level"]]
+
+def scale_particles(count):
+    return max(1, round(count * quality_settings()["particles"]))
+
+def video_stride():
+    return max(1, VIDEO_FPS // quality_settings()["video_fps"])
+
+def set_quality(level, now=0.0):
+    # Samples taken at the old level say nothing about the new one
+    quality["level"] = max(0, min(level, len(QUALITY_LEVELS) - 1))
+    set_render_scale(render["base_scale"] * quality_settings()["render_scale"])
+    quality["frame_times"].clear()
+    quality["last_change"] = now
+    quality["changes"] += 1
+
+def pin_quality(level):
+    # Hold a level by index or name, None hands control back to the governor
+    if level is None:
+        quality["pinned"] = False
+        return
+    if isinstance(level, str):
+        level = [settings["name"] for settings in QUALITY_LEVELS].index(level)
+    set_quality(level)
+    quality["pinned"] = True
+
+def update_quality(frame_time, now):
+    # Step down as soon as a full window runs over budget, step up only after a calm stretch with clear headroom
+    quality["frame_times"].append(frame_time)
+    if quality["pinned"] or len(quality["frame_times"]) < QUALITY_WINDOW:
+        return
+    slow = np.percentile(quality["frame_times"], 90)
+    if slow > QUALITY_BUDGET and quality["level"] > 0:
+        set_quality(quality["level"] - 1, now)
+    elif (slow < QUALITY_BUDGET * QUALITY_UPGRADE_HEADROOM and quality["level"] < len(QUALITY_LEVELS) - 1 and
+          now - quality["last_change"] >= QUALITY_UPGRADE_DELAY):
+        set_quality(quality["level"] + 1, now)
+
+def draw_profile_overlay(surface):
+    rows = profile_history()
+    if not len(rows):
+        return
+    font = res["PENALTY_FONT"]
+    frame_ms = profiler["frame_times"][rows] * 1000
+    panel = pygame.Rect(WIDTH - 420, 60, 400, 330)
+    mark_dirty(surface.fill((0, 0, 0), panel))
+    
+    # Frame-time graph, the line marks the FPS budget
+    graph = pygame.Rect(panel.x + 10, panel.y + 10, panel.width - 20, 100)
+    budget_ms = 1000 / FPS
+    scale = graph.height / (budget_ms * 2)
+    recent = frame_ms[-graph.width:]
+    points = [(graph.x + i, graph.bottom - min(graph.height, value * scale)) for i, value in enumerate(recent)]
+    if len(points) > 1:
+        pygame.draw.lines(surface, GREEN, False, points)
+    pygame.draw.line(surface, RED, (graph.x, graph.bottom - budget_ms * scale), (graph.right, graph.bottom - budget_ms * scale))
+    
+    # Percentiles, mean phase times and entity counts
+    y = graph.bottom + 10
+    for label, value in zip(["p50 ms: ", "p95 ms: ", "p99 ms: "], np.percentile(frame_ms, [50, 95, 99])):
+        draw_label(label, f"{value:.2f}", font, WHITE, (panel.x + 10, y), surface)
+        y += 24
+    phase_ms = profiler["durations"][rows].mean(axis=0) * 1000
+    for index, phase in enumerate(PROFILE_PHASES):
+        if "." not in phase or phase == "draw.present":
+            draw_label(f"{phase}: ", f"{phase_ms[index]:.2f}", font, WHITE, (panel.x + 10, y), surface)
+            y += 24
+    y = graph.bottom + 10
+    for index, name in enumerate(PROFILE_COUNTS):
+        draw_label(f"{name}: ", int(profiler["counts"][rows[-1], index]), font, WHITE, (panel.x + 220, y), surface)
+        y += 24
+    # The quality name is text, the glyph atlas behind draw_label only has digits
+    name = quality_settings()["name"] + (" (pinned)" if quality["pinned"] else "")
+    mark_dirty(surface.blit(render_text(font, f"quality: {name}", WHITE), (panel.x + 220, y)))
+
+def export_profile(path):
+    rows = profile_history()
+    if path.endswith(".json"):
+        # Chrome trace: one complete event per phase per frame, nested by time
+        events = []
+        for row in rows:
+            for index, phase in enumerate(PROFILE_PHASES):
+                if profiler["durations"][row, index] > 0:
+                    events.append({"name": phase, "cat": phase.split(".")[0], "ph": "X", "pid": 1, "tid": 1,
+                                   "ts": (profiler["frame_starts"][row] + profiler["phase_offsets"][row, index]) * 1e6,
+                                   "dur": profiler["durations"][row, index] * 1e6})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "frame_ms"] + [f"{phase}_ms" for phase in PROFILE_PHASES] + PROFILE_COUNTS)
+            for number, row in zip(range(profiler["frames"] - len(rows), profiler["frames"]), rows):
+                writer.writerow([number, round(profiler["frame_times"][row] * 1000, 4)] +
+                                [round(value * 1000, 4) for value in profiler["durations"][row]] + list(profiler["counts"][row]))
+    print(f"Profile written to {path}")
+
+# Memory diagnostics functions
+def start_memory_diagnostics(frames=MEMORY_TRACE_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    memory["enabled"] = True
+    
+    # Lines of the diagnostics themselves and their comprehensions, what they allocate is left out of the records
+    codes = [function.__code__ for function in (resident_memory, live_surfaces, surface_bytes, record_memory,
+                                                reset_memory_baseline, memory_report, print_memory_report)]
+    memory["own_lines"] = set()
+    while codes:
+        code = codes.pop()
+        memory["own_lines"].update(line for start, end, line in code.co_lines() if line)
+        codes += [const for const in code.co_consts if isinstance(const, type(code))]
+
+def resident_memory():
+    # Current resident set size in bytes, where /proc is missing the peak is the best available figure
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def live_surfaces():
+    # Surfaces reachable from the game's module state. Surfaces are invisible to gc.get_objects(), so walk
+    # the references instead, without following modules, classes, functions or stack frames
+    surfaces, seen = {}, set()
+    pending = list(globals().values())
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (types.ModuleType, type, types.FunctionType, types.FrameType, str, bytes)):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, pygame.Surface):
+            surfaces[id(obj)] = obj
+        elif isinstance(obj, np.ndarray):
+            if obj.dtype == object:
+                pending.extend(obj.ravel().tolist())
+        else:
+            pending.extend(gc.get_referents(obj))
+    return list(surfaces.values())
+
+def surface_bytes(surface):
+    # Subsurfaces share their parent's pixels
+    return 0 if surface.get_parent() is not None else surface.get_pitch() * surface.get_height()
+
+def record_memory(label):
+    # Only per-line totals are kept, whole snapshots would hold millions of objects and slow the collector
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, "<unknown>")])
+    own = memory["own_lines"]
+    sites = {stat.traceback[0]: (stat.size, stat.count) for stat in snapshot.statistics("lineno")
+             if not (stat.traceback[0].filename == __file__ and stat.traceback[0].lineno in own)}
+    del snapshot
+    surfaces = live_surfaces()
+    record = {
+        "sites": sites,
+        "surfaces": len(surfaces),
+        "surface_bytes": sum(surface_bytes(surface) for surface in surfaces),
+        "rss": resident_memory(),
+        "transition": memory["transitions"].get(label, 0)
+    }
+    # Counted per state, so a state's report spans its own transitions and not every state change in between
+    memory["transitions"][label] = record["transition"] + 1
+    memory["baseline"].setdefault(label, record)
+    memory["latest"][label] = record
+
+def reset_memory_baseline():
+    # Start comparing from the next transitions, after caches have warmed up
+    memory["baseline"] = {}
+    memory["latest"] = {}
+
+def memory_report(top=MEMORY_TOP):
+    # Growth per state from its first recorded transition to its latest, with the allocation sites that grew most
+    report = []
+    for label, latest in memory["latest"].items():
+        baseline = memory["baseline"][label]
+        growth = []
+        for site, (size, count) in latest["sites"].items():
+            base_size, base_count = baseline["sites"].get(site, (0, 0))
+            if size > base_size:
+                growth.append((size - base_size, count - base_count, site))
+        growth.sort(key=lambda item: item[0], reverse=True)
+        report.append({
+            "state": label,
+            "transitions": latest["transition"] - baseline["transition"],
+            "surfaces": (baseline["surfaces"], latest["surfaces"]),
+            "surface_bytes": (baseline["surface_bytes"], latest["surface_bytes"]),
+            "rss": (baseline["rss"], latest["rss"]),
+            "growth": growth[:top]
+        })
+    return report
+
+def print_memory_report(report):
+    for row in report:
+        surfaces, pixels, rss = row["surfaces"], row["surface_bytes"], row["rss"]
+        print(f"{row['state']} over {row['transitions']} transitions: surfaces {surfaces[0]} -> {surfaces[1]}, "
+              f"surface memory {pixels[0] / 2 ** 20:.1f} -> {pixels[1] / 2 ** 20:.1f} MiB, RSS {rss[0] / 2 ** 20:.1f} -> {rss[1] / 2 ** 20:.1f} MiB")
+        for size, count, site in row["growth"]:
+            print(f"    {size / 1024:+9.1f} KiB {count:+7d} blocks  {site}")
+
+# Input recording functions
+def read_input():
+    pressed = pygame.key.get_pressed()
+    return {
+        "keys": KeyState(key for key in INPUT_KEYS if pressed[key]),
+        "mouse_pos": pygame.mouse.get_pos(),
+        "mouse_pressed": pygame.mouse.get_pressed()[:3]
+    }
+
+def start_recording(path, seed):
+    recorder["file"] = gzip.open(path, "wb")
+    recorder["file"].write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, seed, TICK_RATE, WIDTH, HEIGHT))
+    recorder["frames"] = 0
+
+def stop_recording():
+    if recorder["file"] is not None:
+        recorder["file"].close()
+        recorder["file"] = None
+
+def record_frame(frame_input, events, ticks):
+    # One frame: ticks simulated, held keys and mouse, then the events handle_events acted on
+    keys = sum(1 << bit for bit, key in enumerate(INPUT_KEYS) if frame_input["keys"][key])
+    buttons = sum(1 << bit for bit, pressed in enumerate(frame_input["mouse_pressed"]) if pressed)
+    events = [event for event in events if event.type in RECORD_EVENT_TYPES]
+    data = [RECORD_FRAME.pack(ticks, keys, *frame_input["mouse_pos"], buttons, len(events))]
+    for event in events:
+        code = event.key if event.type == pygame.KEYDOWN else getattr(event, "button", 0)
+        data.append(RECORD_EVENT.pack(RECORD_EVENT_TYPES.index(event.type), code, *getattr(event, "pos", (0, 0))))
+    recorder["file"].write(b"".join(data))
+    recorder["frames"] += 1
+
+def read_recording(path):
+    with gzip.open(path, "rb") as f:
+        data = f.read()
+    magic, version, seed, tick_rate, width, height = RECORD_HEADER.unpack_from(data)
+    if magic != RECORD_MAGIC or version != RECORD_VERSION:
+        raise ValueError(f"{path} is not a Container Tanker recording")
+    if tick_rate != TICK_RATE:
+        raise ValueError(f"{path} was recorded at {tick_rate} ticks per second, the game runs at {TICK_RATE}")
+    
+    frames = []
+    offset = RECORD_HEADER.size
+    try:
+        while offset < len(data):
+            ticks, keys, x, y, buttons, count = RECORD_FRAME.unpack_from(data, offset)
+            offset += RECORD_FRAME.size
+            events = []
+            for _ in range(count):
+                kind, code, event_x, event_y = RECORD_EVENT.unpack_from(data, offset)
+                offset += RECORD_EVENT.size
+                event_type = RECORD_EVENT_TYPES[kind]
+                if event_type == pygame.KEYDOWN:
+                    events.append(pygame.event.Event(event_type, key=code, mod=0))
+                elif event_type == pygame.MOUSEBUTTONDOWN:
+                    events.append(pygame.event.Event(event_type, button=code, pos=(event_x, event_y)))
+                else:
+                    events.append(pygame.event.Event(event_type))
+            frame_input = {
+                "keys": KeyState(key for bit, key in enumerate(INPUT_KEYS) if keys >> bit & 1),
+                "mouse_pos": (x, y),
+                "mouse_pressed": tuple(bool(buttons >> bit & 1) for bit in range(3))
+            }
+            frames.append((ticks, frame_input, events))
+    except struct.error:
+        # A session that was killed mid-write ends with a partial frame
+        pass
+    return seed, (width, height), frames
+
+def replay_frame(ticks, frame_input, events):
+    game["input"] = frame_input
+    if not handle_events(events):
+        return False
+    for _ in range(ticks):
+        update_game()
+    return True
+
+# Decal functions
+def get_decal_layer(name):
+    if decals[name] is None:
+        decals[name] = display_format(pygame.Surface(view_size(), pygame.SRCALPHA), True)
+        decals[name].fill((0, 0, 0, 0))
+    return decals[name]
+
+def get_scorch_sprite():
+    # Dark blotch, most opaque at the center
+    if decals["scorch_sprite"] is None:
+        size = max(1, round(SCORCH_RADIUS * render["scale"]))
+        sprite = pygame.Surface((size * 2, size * 2), pygame.SRCALPHA)
+        for radius in range(size, 0, -2):
+            alpha = int(SCORCH_ALPHA * (1 - radius / size) ** 0.5)
+            pygame.draw.circle(sprite, (20, 15, 10, alpha), (size, size), radius)
+        decals["scorch_sprite"] = display_format(sprite, True)
+    return decals["scorch_sprite"]
+
+def union_bounds(bounds, rect):
+    return rect.copy() if bounds is None else bounds.union(rect)
+
+def clear_decals():
+    for name in ["tracks", "scorch"]:
+        if decals[name] is not None and decals[name + "_bounds"] is not None:
+            decals[name].fill((0, 0, 0, 0), decals[name + "_bounds"])
+        decals[name + "_bounds"] = None
+    decals["track_stamps"].clear()
+    decals["last_track"] = None
+    decals["fade_time"] = game["time"]
+    decals["changed"] = []
+    decals["composite_background"] = None
+    render["full_redraw"] = True
+
+def scale_rect(rect, factor, pad=0):
+    # Smallest whole-pixel rect covering rect at the new scale, grown by pad for the resampling filter
+    left, top = math.floor(rect.left * factor) - pad, math.floor(rect.top * factor) - pad
+    right, bottom = math.ceil(rect.right * factor) + pad, math.ceil(rect.bottom * factor) + pad
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+def rescale_decals(factor):
+    # Resample the layers to the new view size, their bounds and track stamps move with them
+    area = pygame.Rect((0, 0), view_size())
+    for name in ["tracks", "scorch"]:
+        if decals[name] is not None:
+            decals[name] = display_format(pygame.transform.smoothscale(decals[name], area.size), True)
+        if decals[name + "_bounds"] is not None:
+            decals[name + "_bounds"] = scale_rect(decals[name + "_bounds"], factor, 1).clip(area)
+    stamps = [(stamp_time, scale_rect(rect, factor, 1).clip(area)) for stamp_time, rect in decals["track_stamps"]]
+    decals["track_stamps"] = deque(stamps)
+    if decals["last_track"] is not None:
+        decals["last_track"] = (round(decals["last_track"][0] * factor), round(decals["last_track"][1] * factor))
+    decals["changed"] = []
+    decals["composite_background"] = None
+
+def update_decals():
+    # Stamp what happened since the last frame and fade the tracks, collecting the rects that changed
+    changed = decals["changed"] = []
+    
+    # Newest track segment only, the rest of the trail is already on the layer
+    if game["state"] == "playing":
+        x, y = to_view(game["tank"].pos)
+        point = (round(x), round(y))
+        if decals["last_track"] is not None and point != decals["last_track"]:
+            width = max(1, round(TRACK_WIDTH * render["scale"]))
+            rect = pygame.draw.line(get_decal_layer("tracks"), TRACK_COLOR, decals["last_track"], point, width)
+            decals["tracks_bounds"] = union_bounds(decals["tracks_bounds"], rect)
+            decals["track_stamps"].append((game["time"], rect))
+            changed.append(rect)
+        decals["last_track"] = point
+    
+    # Scorch marks are stamped once per hit and are never faded
+    for effect in game["collision_effects"]:
+        if not effect.scorched:
+            effect.scorched = True
+            sprite = get_scorch_sprite()
+            rect = get_decal_layer("scorch").blit(sprite, sprite.get_rect(center=to_view(effect.pos)))
+            decals["scorch_bounds"] = union_bounds(decals["scorch_bounds"], rect)
+            changed.append(rect)
+    
+    # Fade every track mark at once, a fixed cost however long the trail is
+    steps = int((game["time"] - decals["fade_time"]) / DECAL_FADE_INTERVAL)
+    if steps < 1:
+        return changed
+    decals["fade_time"] += steps * DECAL_FADE_INTERVAL
+    bounds = decals["tracks_bounds"]
+    if bounds is None:
+        return changed
+    step = max(1, round(255 * DECAL_FADE_INTERVAL / (TRAIL_LENGTH * quality_settings()["trail"])))
+    decals["tracks"].fill((0, 0, 0, min(255, steps * step)), bounds, special_flags=pygame.BLEND_RGBA_SUB)
+    changed.append(bounds)
+    
+    # Drop segments that have faded out so the faded area shrinks behind the tank
+    stamps = decals["track_stamps"]
+    lifetime = math.ceil(255 / step) * DECAL_FADE_INTERVAL
+    while stamps and decals["fade_time"] - stamps[0][0] >= lifetime:
+        stamps.popleft()
+    decals["tracks_bounds"] = stamps[0][1].unionall([rect for stamp_time, rect in stamps]) if stamps else None
+    return changed
+
+def draw_decals(surface, area=None):
+    for name in ["scorch", "tracks"]:
+        bounds = decals[name + "_bounds"]
+        if bounds is None:
+            continue
+        rect = bounds if area is None else bounds.clip(area)
+        if rect.width and rect.height:
+            surface.blit(decals[name], rect, rect)
+
+def get_decorated_background(background, changed):
+    # Background with the decals baked in, so restoring a dirty rect stays a single opaque blit
+    if decals["tracks_bounds"] is None and decals["scorch_bounds"] is None and not changed:
+        return background
+    composite = decals["composite"]
+    if composite is None or decals["composite_background"] is not background:
+        if composite is None:
+            composite = decals["composite"] = display_format(pygame.Surface(view_size()))
+        composite.blit(background, (0, 0))
+        draw_decals(composite)
+        decals["composite_background"] = background
+    else:
+        for rect in changed:
+            composite.blit(background, rect, rect)
+            draw_decals(composite, rect)
+    return composite
+
+# Render functions
+def view_size():
+    return max(1, round(WIDTH * render["scale"])), max(1, round(HEIGHT * render["scale"]))
+
+def to_view(point):
+    # Logical playfield coordinates to world surface pixels
+    if render["scale"] == 1:
+        return point
+    return point[0] * render["scale"], point[1] * render["scale"]
+
+def view_image(image):
+    # Sprites are scaled down once per render scale, rotations are cached from the scaled copy
+    if render["scale"] == 1:
+        return image
+    scaled = render["view_images"].get(image)
+    if scaled is None:
+        size = (max(1, round(image.get_width() * render["scale"])), max(1, round(image.get_height() * render["scale"])))
+        scaled = render["view_images"][image] = pygame.transform.smoothscale(image, size)
+    return scaled
+
+def get_world():
+    # The screen itself at full scale, otherwise an offscreen surface at the internal resolution
+    if render["scale"] == 1:
+        return screen
+    if render["world"] is None:
+        render["world"] = display_format(pygame.Surface(view_size()))
+    return render["world"]
+
+def upscale_rect(world, rect):
+    # Scale one world rect, grown to whole tiles, into the matching window rect
+    p, q = render["upscale_tile"]
+    left, top = rect.left // p * p, rect.top // p * p
+    right = min(world.get_width(), -(-rect.right // p) * p)
+    bottom = min(world.get_height(), -(-rect.bottom // p) * p)
+    if right <= left or bottom <= top:
+        return None
+    source = pygame.Rect(left, top, right - left, bottom - top)
+    target = pygame.Rect(left * q // p, top * q // p, source.width * q // p, source.height * q // p)
+    pygame.transform.scale(world.subsurface(source), target.size, screen.subsurface(target))
+    return target
+
+def world_rect(rect):
+    # Window rect to the world rect that covers it
+    scale = render["scale"]
+    left, top = int(rect.left * scale), int(rect.top * scale)
+    return pygame.Rect(left, top, math.ceil(rect.right * scale) - left, math.ceil(rect.bottom * scale) - top)
+
+def get_view_background(background):
+    # Mapped video frames and the gradient are window sized, scale the current one to the world once
+    if background.get_size() == view_size():
+        return background
+    if render["view_background_source"] is not background:
+        if render["view_background"] is None:
+            render["view_background"] = display_format(pygame.Surface(view_size()))
+        pygame.transform.scale(background, view_size(), render["view_background"])
+        render["view_background_source"] = background
+    return render["view_background"]
+
+def mark_dirty(rect):
+    render["dirty_rects"].append(rect)
+
+def mark_dirty_union(rects):
+    # One rect per effect keeps the update list short when particles overlap
+    if rects:
+        mark_dirty(rects[0].unionall(rects[1:]))
+
+def get_rotated(image, angle, step=ROTATION_STEP, smooth=False):
+    # Angles are snapped to step degrees so each sprite has a bounded set of rotations
+    angle = round(angle / step) * step % 360
+    key = (image, angle, smooth)
+    cache = render["rotation_cache"]
+    rotated = cache.get(key)
+    if rotated is not None:
+        cache.move_to_end(key)
+        return rotated
+    
+    rotated = pygame.transform.rotozoom(image, angle, 1.0) if smooth else pygame.transform.rotate(image, angle)
+    cache[key] = rotated
+    render["rotation_cache_bytes"] += rotated.get_pitch() * rotated.get_height()
+    
+    # Evict least recently used rotations once over the memory cap
+    while render["rotation_cache_bytes"] > ROTATION_CACHE_BYTES and len(cache) > 1:
+        _, evicted = cache.popitem(last=False)
+        render["rotation_cache_bytes"] -= evicted.get_pitch() * evicted.get_height()
+    return rotated
+
+def prewarm_rotations(image):
+    for step in range(math.ceil(360 / ROTATION_STEP)):
+        get_rotated(image, step * ROTATION_STEP)
+
+def render_text(font, text, color, antialias=True):
+    key = (font, text, color, antialias)
+    cache = render["text_cache"]
+    surface = cache.get(key)
+    if surface is not None:
+        cache.move_to_end(key)
+        return surface
+    
+    surface = font.render(text, antialias, color)
+    cache[key] = surface
+    if len(cache) > TEXT_CACHE_SIZE:
+        cache.popitem(last=False)
+    return surface
+
+def get_glyph_atlas(font, color):
+    key = (font, color)
+    atlas = render["glyph_atlases"].get(key)
+    if atlas is None:
+        atlas = {char: font.render(char, True, color) for char in GLYPH_CHARACTERS}
+        render["glyph_atlases"][key] = atlas
+    return atlas
+
+def draw_number(value, font, color, pos, surface):
+    # Compose a changing number from pre-rendered digits instead of rasterizing it each frame
+    atlas = get_glyph_atlas(font, color)
+    x, y = pos
+    rects = []
+    for char in str(value):
+        rects.append(surface.blit(atlas[char], (x, y)))
+        x += atlas[char].get_width()
+    mark_dirty_union(rects)
+
+def draw_label(text, value, font, color, pos, surface):
+    label = render_text(font, text, color)
+    mark_dirty(surface.blit(label, pos))
+    draw_number(value, font, color, (pos[0] + label.get_width(), pos[1]), surface)
+
+def create_gradient_background():
+    background = display_format(pygame.Surface((WIDTH, HEIGHT)))
+    for y in range(HEIGHT):
+        pygame.draw.line(background, (0, 0, int(50 * (y / HEIGHT))), (0, y), (WIDTH, y))
+    return background
+
+def get_background():
+    if game["background_frame"] is not None:
+        return game["background_frame"]
+    if render["background"] is None:
+        render["background"] = create_gradient_background()
+    return render["background"]
+
+# Texture renderer functions
+def open_renderer(software=False):
+    # A window drawn through SDL's renderer, on the GPU when one is available or on SDL's software renderer
+    global screen
+    if sdl2_video is None:
+        raise pygame.error("pygame._sdl2.video is not available")
+    try:
+        window = sdl2_video.Window("CONTAİNER TANKER", (WIDTH, HEIGHT))
+        renderer = sdl2_video.Renderer(window, accelerated=0 if software else -1)
+    except sdl2_video.error as e:
+        raise pygame.error(str(e))
+    render["backend"] = "software" if software else "texture"
+    render["window"] = window
+    render["renderer"] = renderer
+    render["textures"] = {}
+    render["particle_texture"] = None
+    screen = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+    set_render_scale(1.0)
+
+def get_texture(image):
+    # Sprites are uploaded once, rotation and alpha are applied by the renderer at draw time
+    texture = render["textures"].get(image)
+    if texture is None:
+        texture = render["textures"][image] = sdl2_video.Texture.from_surface(render["renderer"], image)
+    return texture
+
+def get_particle_texture():
+    # One white disc, stretched to each particle's size and tinted to its color
+    if render["particle_texture"] is None:
+        sprite = pygame.Surface((PARTICLE_MAX_SIZE * 4, PARTICLE_MAX_SIZE * 4), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, WHITE, (PARTICLE_MAX_SIZE * 2, PARTICLE_MAX_SIZE * 2), PARTICLE_MAX_SIZE * 2)
+        render["particle_texture"] = sdl2_video.Texture.from_surface(render["renderer"], sprite)
+    return render["particle_texture"]
+
+def update_texture(name, surface, rects=None):
+    # Window-sized streaming texture mirroring a surface, only the given rects are uploaded unless rects is None
+    texture = render[name]
+    if texture is None:
+        texture = render[name] = sdl2_video.Texture(render["renderer"], surface.get_size(), streaming=True)
+        texture.blend_mode = 1 if surface.get_flags() & pygame.SRCALPHA else 0
+        rects = None
+    if rects is None:
+        texture.update(surface)
+        return texture
+    bounds = surface.get_rect()
+    for rect in rects:
+        rect = rect.clip(bounds)
+        if rect.width and rect.height:
+            texture.update(surface.subsurface(rect), rect)
+    return texture
+
+def draw_tank_texture(tank, alpha=1.0):
+    # The renderer rotates clockwise, pygame.transform.rotate counterclockwise
+    center = interpolate(tank, alpha)
+    for image, angle in [(tank.original_body_image, -tank.angle), (tank.turret_image, math.degrees(tank.turret_angle))]:
+        texture = get_texture(image)
+        texture.draw(dstrect=texture.get_rect(center=center), angle=angle)
+
+def draw_bullet_texture(bullet, alpha=1.0):
+    texture = get_texture(bullet.image)
+    texture.draw(dstrect=texture.get_rect(center=interpolate(bullet, alpha)), angle=bullet.angle)
+
+def draw_targets_texture(targets, alpha=1.0):
+    if not len(targets):
+        return
+    center = targets.prev_pos + (targets.pos - targets.prev_pos) * alpha
+    topleft = (round_center(center) - targets.size // 2).tolist()
+    for image, (x, y), (width, height) in zip(targets.images, topleft, targets.size.tolist()):
+        get_texture(image).draw(dstrect=(x, y, width, height))
+
+def draw_particles_texture(particles):
+    # Tinted textured quads, alpha is applied exactly rather than from the atlas' levels
+    alpha = np.rint(particles.alpha).astype(int)
+    visible = alpha > 0
+    if not visible.any():
+        return
+    radius = np.clip(particles.size[visible].astype(int), 1, PARTICLE_MAX_SIZE)
+    topleft = particles.pos[visible] - radius[:, None]
+    texture = get_particle_texture()
+    palette = particles.palette
+    for (x, y), size, color, value in zip(topleft.tolist(), (radius * 2).tolist(), particles.color[visible].tolist(), alpha[visible].tolist()):
+        texture.color = palette[color]
+        texture.alpha = value
+        texture.draw(dstrect=(x, y, size, size))
+
+def draw_game_texture(alpha=1.0):
+    # Every frame is composed from textures, only background, decal and UI pixels that changed are uploaded
+    start = profile_begin()
+    background = get_background()
+    changed_decals = update_decals()
+    base = get_decorated_background(background, changed_decals)
+    full_redraw = (not RENDER_DIRTY_RECTS or render["full_redraw"] or
+                   background is not render["last_background"] or base is not render["background_base"])
+    update_texture("background_texture", base, None if full_redraw else changed_decals).draw()
+    profile_end("draw.background", start)
+    
+    if game["state"] in ["starting", "end", "game_over"]:
+        for anim in game["animations"]:
+            draw_particles_texture(anim.particles)
+        for effect in game["collision_effects"]:
+            draw_particles_texture(effect.particles)
+    
+    elif game["state"] == "playing":
+        start = profile_begin()
+        draw_tank_texture(game["tank"], alpha)
+        profile_end("draw.tank", start)
+        
+        start = profile_begin()
+        for bullet in game["bullets"]:
+            draw_bullet_texture(bullet, alpha)
+        profile_end("draw.bullets", start)
+        
+        start = profile_begin()
+        draw_targets_texture(game["targets"], alpha)
+        profile_end("draw.targets", start)
+        
+        start = profile_begin()
+        for effect in game["collision_effects"]:
+            draw_particles_texture(effect.particles)
+        for anim in game["animations"]:
+            draw_particles_texture(anim.particles)
+        profile_end("draw.effects", start)
+    
+    # The UI is still drawn with surfaces onto a transparent overlay, last frame's UI is erased from it first
+    if full_redraw:
+        screen.fill((0, 0, 0, 0))
+    else:
+        for rect in render["prev_ui_rects"]:
+            screen.fill((0, 0, 0, 0), rect)
+    render["dirty_rects"] = []
+    draw_ui(screen)
+    
+    start = profile_begin()
+    overlay = update_texture("overlay_texture", screen, None if full_redraw else render["prev_ui_rects"] + render["dirty_rects"])
+    for rect in render["dirty_rects"]:
+        rect = rect.clip(screen.get_rect())
+        if rect.width and rect.height:
+            overlay.draw(srcrect=rect, dstrect=rect)
+    render["renderer"].present()
+    render["prev_ui_rects"] = render["dirty_rects"]
+    render["last_background"] = background
+    render["background_base"] = base
+    render["full_redraw"] = False
+    profile_end("draw.present", start)
 
 # Game loop functions
-def handle_events():
-    for event in pygame.event.get():
+def handle_events(events=None):
+    for event in pygame.event.get() if events is None else events:
         if event.type == pygame.QUIT:
             return False
         
+        # Window contents were lost, repaint everything on the next frame
+        if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+            render["full_redraw"] = True
+        
         # Mouse events
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            mouse_pos = pygame.mouse.get_pos()
+            mouse_pos = event.pos
             
             # Menu state
             if game["state"] == "menu":
                 if ui["start_button"]["rect"].collidepoint(mouse_pos):
-                    game["level"] = 1
-                    game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                    game["state"] = "starting"
+                    start_game()
                 elif ui["quit_button"]["rect"].collidepoint(mouse_pos):
                     return False
             
@@ -452,36 +2217,32 @@ def handle_events():
             # End state
             elif game["state"] == "end":
                 if ui["replay_button"]["rect"].collidepoint(mouse_pos):
-                    game["level"] = 1
-                    game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                    game["state"] = "starting"
+                    restart_game()
                 elif ui["menu_button"]["rect"].collidepoint(mouse_pos):
                     reset_to_menu()
                 elif ui["next_button"]["rect"].collidepoint(mouse_pos) and game["level"] < len(level_configs):
                     game["level"] += 1
                     start_level()
                 elif ui["restart_button"]["rect"].collidepoint(mouse_pos) and game["level"] == len(level_configs):
-                    game["level"] = 1
-                    game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                    game["state"] = "starting"
+                    restart_game()
                 elif ui["final_menu_button"]["rect"].collidepoint(mouse_pos) and game["level"] == len(level_configs):
                     reset_to_menu()
             
             # Game over state
             elif game["state"] == "game_over":
                 if ui["retry_button"]["rect"].collidepoint(mouse_pos):
-                    game["level"] = 1
-                    game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                    game["state"] = "starting"
+                    restart_game()
                 elif ui["lose_menu_button"]["rect"].collidepoint(mouse_pos):
                     reset_to_menu()
         
         # Keyboard events
-        if event.type == pygame.KEYDOWN:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            profiler["enabled"] = True
+            profiler["overlay"] = not profiler["overlay"]
+            render["full_redraw"] = True
+        elif event.type == pygame.KEYDOWN:
             if game["state"] == "menu" and event.key == pygame.K_s:
-                game["level"] = 1
-                game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                game["state"] = "starting"
+                start_game()
             elif event.key == pygame.K_q:
                 if game["state"] in ["menu", "end", "game_over"]:
                     if game["state"] == "menu":
@@ -489,9 +2250,7 @@ def handle_events():
                     else:
                         reset_to_menu()
             elif event.key == pygame.K_r and game["state"] in ["end", "game_over"]:
-                game["level"] = 1
-                game["animations"] = [create_starburst_animation("Container Tanker Starting!", WIDTH // 2, HEIGHT // 2)]
-                game["state"] = "starting"
+                restart_game()
             elif event.key == pygame.K_SPACE and game["state"] == "end" and game["level"] < len(level_configs):
                 game["level"] += 1
                 start_level()
@@ -499,183 +2258,318 @@ def handle_events():
     return True
 
 def update_game():
+    # Advance the simulation clock by one fixed tick
+    game["time"] += SIM_DT
+    
     # Update background
     update_background_frame()
     
-    # Handle common events
-    if not handle_events():
-        return False
-    
     # Update based on game state
     if game["state"] == "menu":
-        update_slider(ui["volume_slider"], pygame.mouse.get_pos(), pygame.mouse.get_pressed())
+        update_slider(ui["volume_slider"], game["input"]["mouse_pos"], game["input"]["mouse_pressed"])
     
     elif game["state"] == "starting":
         # Update animations
-        for anim in game["animations"][:]:
-            if not update_starburst_animation(anim):
-                game["animations"].remove(anim)
+        game["animations"] = update_animations(game["animations"])
         if not game["animations"]:
             start_level()
     
     elif game["state"] == "playing":
         # Update tank
-        update_tank(game["tank"], pygame.key.get_pressed(), pygame.mouse.get_pos())
+        start = profile_begin()
+        update_tank(game["tank"], game["input"]["keys"], game["input"]["mouse_pos"])
+        profile_end("update.tank", start)
         
-        # Update bullets
-        for bullet in game["bullets"][:]:
-            if not update_bullet(bullet):
-                game["bullets"].remove(bullet)
+        # Update bullets and targets
+        start = profile_begin()
+        spent = update_bullets(game["bullets"])
+        profile_end("update.bullets", start)
+        start = profile_begin()
+        update_targets(game["targets"])
+        profile_end("update.targets", start)
         
-        # Update targets and check collisions
-        for target in game["targets"][:]:
-            update_target(target)
-            
-            # Check tank collision
-            if game["tank"]["body_rect"].colliderect(target["rect"]):
-                game["collision_effects"].append(create_collision_effect(game["tank"]["pos"].x, game["tank"]["pos"].y))
-                if res["collision_sound"]:
-                    res["collision_sound"].play()
-                game["animations"] = [create_starburst_animation("Game Over! Tank Hit Target!", WIDTH // 2, HEIGHT // 2)]
-                game["state"] = "game_over"
-                break
-            
-            # Check bullet collisions
-            for bullet in game["bullets"][:]:
-                if target["rect"].colliderect(bullet["rect"]):
-                    game["targets"].remove(target)
-                    game["bullets"].remove(bullet)
-                    game["collision_effects"].append(create_collision_effect(target["pos"].x, target["pos"].y))
-                    if res["collision_sound"]:
-                        res["collision_sound"].play()
-                    break
+        # Bucket targets into the broadphase grid
+        start = profile_begin()
+        tank, targets = game["tank"], game["targets"]
+        bounds = target_bounds(targets)
+        grid = collision_grid(bounds)
         
-        # Update effects
-        for effect in game["collision_effects"][:]:
-            if not update_collision_effect(effect):
-                game["collision_effects"].remove(effect)
+        # Check tank collision
+        if tank_hits_target(tank, bounds, grid):
+            game["collision_effects"].append(create_collision_effect(tank.pos.x, tank.pos.y))
+            play_sound("collision_sound")
+            set_animation(create_starburst_animation("Game Over! Tank Hit Target!", WIDTH // 2, HEIGHT // 2))
+            change_state("game_over")
+            hits = []
         
-        # Update animations
-        for anim in game["animations"][:]:
-            if not update_starburst_animation(anim):
-                game["animations"].remove(anim)
+        # Check bullet collisions
+        else:
+            hits = find_bullet_hits(game["bullets"], bounds, grid, targets.pos - targets.prev_pos)
+            for bullet_index, target_index in hits:
+                game["collision_effects"].append(create_collision_effect(*targets.pos[target_index].tolist()))
+                play_sound("collision_sound")
+        remove_hits(hits, spent)
+        profile_end("update.collisions", start)
+        
+        # Update effects and animations
+        start = profile_begin()
+        game["collision_effects"] = update_collision_effects(game["collision_effects"])
+        game["animations"] = update_animations(game["animations"])
+        profile_end("update.effects", start)
         
         # Check win/lose conditions
         if not game["targets"]:
             config = level_configs[game["level"] - 1]
             text = f"{config['title']} Achieved!" if config["title"] else f"Level {game['level']} Completed!"
-            game["animations"] = [create_starburst_animation(text, WIDTH // 2, HEIGHT // 2, 4.0, 20, True)]
-            if res["win_sound"]:
-                res["win_sound"].play()
-            game["state"] = "end"
+            set_animation(create_starburst_animation(text, WIDTH // 2, HEIGHT // 2, 4.0, 20, True))
+            play_sound("win_sound")
+            change_state("end")
+            prepare_level(game["level"] + 1)
         
         if game["bullets_left"] == 0 and not game["bullets"] and game["targets"]:
-            game["animations"] = [create_starburst_animation("Game Over! Bullets Depleted!", WIDTH // 2, HEIGHT // 2)]
-            game["state"] = "game_over"
+            set_animation(create_starburst_animation("Game Over! Bullets Depleted!", WIDTH // 2, HEIGHT // 2))
+            change_state("game_over")
     
     elif game["state"] in ["end", "game_over"]:
-        # Update effects
-        for effect in game["collision_effects"][:]:
-            if not update_collision_effect(effect):
-                game["collision_effects"].remove(effect)
-        
-        # Update animations
-        for anim in game["animations"][:]:
-            if not update_starburst_animation(anim):
-                game["animations"].remove(anim)
-    
-    return True
+        # Update effects and animations
+        game["collision_effects"] = update_collision_effects(game["collision_effects"])
+        game["animations"] = update_animations(game["animations"])
 
-def draw_game():
-    # Draw background
-    if game["video_frames"] and game["current_frame_index"] < len(game["video_frames"]):
-        screen.blit(game["video_frames"][game["current_frame_index"]], (0, 0))
-    else:
-        # Fallback gradient background
-        for y in range(HEIGHT):
-            pygame.draw.line(screen, (0, 0, int(50 * (y / HEIGHT))), (0, y), (WIDTH, y))
-    
-    # Draw based on game state
+def draw_ui(surface):
+    # The UI for the current state, drawn at window resolution over the world
     if game["state"] == "menu":
         # Draw title
-        title = res["FONT"].render("Container Tanker", True, WHITE)
+        title = render_text(res["FONT"], "Container Tanker", WHITE)
         title_rect = title.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 100))
-        title = pygame.transform.rotozoom(title, math.sin(pygame.time.get_ticks() / 1000) * 5, 1.0)
-        screen.blit(title, title.get_rect(center=title_rect.center))
+        title = get_rotated(title, math.sin(pygame.time.get_ticks() / 1000) * 5, TITLE_ROTATION_STEP, smooth=True)
+        mark_dirty(surface.blit(title, title.get_rect(center=title_rect.center)))
         
         # Draw buttons
-        draw_button(ui["start_button"], screen)
-        draw_button(ui["quit_button"], screen)
-        draw_slider(ui["volume_slider"], screen)
+        draw_button(ui["start_button"], surface)
+        draw_button(ui["quit_button"], surface)
+        draw_slider(ui["volume_slider"], surface)
     
     elif game["state"] in ["starting", "end", "game_over"]:
-        # Draw animations
         for anim in game["animations"]:
-            draw_starburst_animation(anim, screen)
-        
-        # Draw collision effects
-        for effect in game["collision_effects"]:
-            draw_collision_effect(effect, screen)
+            draw_starburst_text(anim, surface)
         
         # Draw buttons for end states
         if game["state"] == "end":
             if game["level"] < len(level_configs):
-                draw_button(ui["next_button"], screen)
-                draw_button(ui["replay_button"], screen)
-                draw_button(ui["menu_button"], screen)
+                draw_button(ui["next_button"], surface)
+                draw_button(ui["replay_button"], surface)
+                draw_button(ui["menu_button"], surface)
             else:
-                draw_button(ui["restart_button"], screen)
-                draw_button(ui["final_menu_button"], screen)
+                draw_button(ui["restart_button"], surface)
+                draw_button(ui["final_menu_button"], surface)
         elif game["state"] == "game_over":
-            draw_button(ui["retry_button"], screen)
-            draw_button(ui["lose_menu_button"], screen)
+            draw_button(ui["retry_button"], surface)
+            draw_button(ui["lose_menu_button"], surface)
+    
+    elif game["state"] == "playing":
+        for anim in game["animations"]:
+            draw_starburst_text(anim, surface)
+        
+        # Draw HUD
+        start = profile_begin()
+        draw_label("Bullets: ", game["bullets_left"], res["PENALTY_FONT"], WHITE, (10, 10), surface)
+        draw_label("Level: ", game["level"], res["PENALTY_FONT"], WHITE, (10, 40), surface)
+        profile_end("draw.hud", start)
+    
+    if profiler["overlay"]:
+        draw_profile_overlay(surface)
+
+def draw_game(alpha=1.0):
+    # Draw background and decals, only repainting last frame's rects and changed decals when the background has not changed
+    if render["renderer"] is not None:
+        draw_game_texture(alpha)
+        return
+    start = profile_begin()
+    world = get_world()
+    background = get_background()
+    changed_decals = update_decals()
+    full_redraw = (not RENDER_DIRTY_RECTS or render["full_redraw"] or
+                   background is not render["last_background"])
+    render["dirty_rects"] = []
+    if background is not render["last_background"]:
+        # A new video frame, composite straight onto the world rather than keeping a baked copy up to date
+        decals["composite_background"] = None
+        world.blit(get_view_background(background), (0, 0))
+        draw_decals(world)
+    else:
+        base = get_decorated_background(get_view_background(background), changed_decals)
+        if full_redraw:
+            world.blit(base, (0, 0))
+        else:
+            for rect in render["prev_dirty_rects"] + changed_decals:
+                world.blit(base, rect, rect)
+            render["dirty_rects"].extend(changed_decals)
+    profile_end("draw.background", start)
+    
+    # Draw the world at the internal resolution
+    if game["state"] in ["starting", "end", "game_over"]:
+        for anim in game["animations"]:
+            draw_starburst_animation(anim, world)
+        for effect in game["collision_effects"]:
+            draw_collision_effect(effect, world)
     
     elif game["state"] == "playing":
-        # Draw game elements
-        draw_tank(game["tank"], screen)
+        start = profile_begin()
+        draw_tank(game["tank"], world, alpha)
+        profile_end("draw.tank", start)
         
+        start = profile_begin()
         for bullet in game["bullets"]:
-            draw_bullet(bullet, screen)
+            draw_bullet(bullet, world, alpha)
+        profile_end("draw.bullets", start)
         
-        for target in game["targets"]:
-            screen.blit(target["image"], target["rect"])
+        start = profile_begin()
+        draw_targets(game["targets"], world, alpha)
+        profile_end("draw.targets", start)
         
+        start = profile_begin()
         for effect in game["collision_effects"]:
-            draw_collision_effect(effect, screen)
+            draw_collision_effect(effect, world)
         
         for anim in game["animations"]:
-            draw_starburst_animation(anim, screen)
-        
-        # Draw HUD
-        bullets_text = res["PENALTY_FONT"].render(f"Bullets: {game['bullets_left']}", True, WHITE)
-        level_text = res["PENALTY_FONT"].render(f"Level: {game['level']}", True, WHITE)
-        screen.blit(bullets_text, (10, 10))
-        screen.blit(level_text, (10, 40))
+            draw_starburst_animation(anim, world)
+        profile_end("draw.effects", start)
     
-    pygame.display.flip()
+    # One upscale to the window, the UI is then drawn over it at native resolution
+    world_rects = render["dirty_rects"]
+    if world is not screen:
+        start = profile_begin()
+        covered = [world_rect(rect) for rect in render["prev_ui_rects"]]
+        rects = render["prev_dirty_rects"] + world_rects + covered
+        full_redraw = full_redraw or render["upscale_tile"] is None or len(rects) > UPSCALE_MAX_RECTS
+        if full_redraw:
+            pygame.transform.scale(world, screen.get_size(), screen)
+            render["dirty_rects"] = []
+        else:
+            # Only what changed in the world, or sat under last frame's UI, is scaled again
+            upscaled = [upscale_rect(world, rect) for rect in rects]
+            render["dirty_rects"] = [rect for rect in upscaled if rect is not None] + render["prev_ui_rects"]
+        profile_end("draw.upscale", start)
+    ui_start = len(render["dirty_rects"])
+    draw_ui(screen)
+    
+    # Present the frame, with an offscreen world the dirty rects are already in window coordinates
+    start = profile_begin()
+    if full_redraw:
+        pygame.display.flip()
+    elif world is screen:
+        pygame.display.update(render["prev_dirty_rects"] + render["dirty_rects"])
+    else:
+        pygame.display.update(render["dirty_rects"])
+    render["prev_dirty_rects"] = render["dirty_rects"] if world is screen else world_rects
+    render["prev_ui_rects"] = render["dirty_rects"][ui_start:]
+    render["last_background"] = background
+    render["full_redraw"] = False
+    profile_end("draw.present", start)
 
-async def main():
-    # Initialize game
-    load_resources()
+async def main(seed=None, record_path=None, size=(WIDTH, HEIGHT), audio=True, render_size=None, backend="surface"):
+    # Initialize game, the menu opens once the critical assets are in
+    init_display(size, audio, backend)
+    set_render_size(render_size or size)
+    start_loading_assets()
+    if not await show_loading_screen():
+        stop_loading_assets()
+        return
     create_ui()
-    game["tank"] = create_tank(WIDTH // 2, HEIGHT // 2)
-    game["last_frame_time"] = pygame.time.get_ticks() / 1000
+    for image_name in ["tank_body_image", "tank_turret_image", "bullet_image"]:
+        prewarm_rotations(res[image_name])
+    seed = random.randrange(2 ** 63) if seed is None else seed
+    new_session(seed)
+    if record_path:
+        start_recording(record_path, seed)
+    start_video_stream()
     
     # Game loop
     clock = pygame.time.Clock()
+    accumulator = 0.0
     running = True
     
     while running:
-        running = update_game()
-        draw_game()
-        clock.tick(FPS)
-        await asyncio.sleep(1.0 / FPS)
+        # clock.tick is the only pacing point, the asyncio yield just hands control to the browser on Pyodide
+        profile_frame()
+        start = profile_begin()
+        accumulator += min(clock.tick(FPS) / 1000, MAX_FRAME_TIME)
+        profile_end("wait", start)
+        
+        start = work_start = time.perf_counter()
+        if assets["pending"]:
+            poll_assets()
+            start_video_stream()
+        events = pygame.event.get()
+        game["input"] = read_input()
+        running = handle_events(events)
+        profile_end("events", start)
+        
+        # Run as many fixed simulation ticks as the elapsed time covers
+        start = profile_begin()
+        ticks = 0
+        while running and accumulator >= SIM_DT:
+            update_game()
+            accumulator -= SIM_DT
+            ticks += 1
+        profile_end("update", start)
+        flush_sounds()
+        if recorder["file"] is not None:
+            record_frame(game["input"], events, ticks)
+        
+        # A closed window skips the ticks, so the leftover time can reach a whole tick and there is nothing to draw
+        start = profile_begin()
+        if running:
+            draw_game(min(1.0, accumulator / SIM_DT))
+        profile_end("draw", start)
+        now = time.perf_counter()
+        update_quality(now - work_start, now)
+        
+        start = profile_begin()
+        await asyncio.sleep(0)
+        profile_end("wait", start)
+    
+    stop_loading_assets()
+    stop_video_stream()
+    stop_recording()
+    if profiler["export_path"]:
+        export_profile(profiler["export_path"])
+    if memory["enabled"]:
+        print_memory_report(memory_report())
 
 if platform.system() == "Emscripten":
     asyncio.ensure_future(main())
 else:
     if __name__ == "__main__":
+        parser = argparse.ArgumentParser(description="Container Tanker")
+        parser.add_argument("--build-frame-cache", action="store_true", help="rebuild the background video frame cache and exit")
+        parser.add_argument("--profile", action="store_true", help="time every frame phase, F3 toggles the overlay")
+        parser.add_argument("--profile-export", metavar="PATH", help="write the profile on exit as CSV, or as a Chrome trace if PATH ends in .json")
+        parser.add_argument("--memory-diagnostics", action="store_true", help="snapshot memory at every state change and report growth on exit")
+        parser.add_argument("--seed", type=int, help="RNG seed for the session")
+        parser.add_argument("--record", metavar="PATH", help="record the seed and input stream for replay.py")
+        parser.add_argument("--size", default=f"{WIDTH}x{HEIGHT}", help="window resolution as WIDTHxHEIGHT")
+        parser.add_argument("--no-audio", action="store_true", help="run without initializing the mixer")
+        parser.add_argument("--render-size", help="internal resolution of the world as WIDTHxHEIGHT, upscaled to the window")
+        parser.add_argument("--backend", choices=RENDER_BACKENDS, default="surface",
+                            help="draw with surfaces, or through SDL's renderer with textures on the GPU or on SDL's software renderer")
+        parser.add_argument("--quality", choices=["auto"] + [settings["name"] for settings in QUALITY_LEVELS], default="auto",
+                            help="pin a quality level instead of adapting it to the frame time")
+        args = parser.parse_args()
+        size = tuple(int(value) for value in args.size.lower().split("x"))
+        render_size = tuple(int(value) for value in args.render_size.lower().split("x")) if args.render_size else None
+        profiler["enabled"] = args.profile or bool(args.profile_export)
+        profiler["export_path"] = args.profile_export
+        if args.memory_diagnostics:
+            start_memory_diagnostics()
+        if args.quality != "auto":
+            pin_quality(args.quality)
+        
+        if args.build_frame_cache:
+            set_resolution(size)
+            build_frame_cache(list_video_frames(), FRAME_CACHE_PATH)
+            sys.exit()
         try:
-            asyncio.run(main())
+            asyncio.run(main(args.seed, args.record, size, not args.no_audio, render_size, args.backend))
         except Exception as e:
             print(f"Game could not be started: {e}")
\ No newline at end of file
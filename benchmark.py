@@ -0,0 +1,190 @@
+import os
+
+# Run without a window or sound card, must be set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import Game
+
+# Scripted scenarios: targets, bullets and collision effects kept alive every frame
+SCENARIOS = {
+    "menu": {"state": "menu", "targets": 0, "bullets": 0, "effects": 0},
+    "level_1": {"state": "playing", "targets": 5, "bullets": 5, "effects": 1},
+    "level_3": {"state": "playing", "targets": 15, "bullets": 15, "effects": 3},
+    "crowded": {"state": "playing", "targets": 200, "bullets": 100, "effects": 20},
+    "horde": {"state": "playing", "targets": 1000, "bullets": 300, "effects": 50}
+}
+
+PHASES = ["handle_events", "update_game", "draw_game"]
+PERCENTILES = [50, 90, 99]
+
+# Scenario setup
+def setup_game(render_size=None, backend="surface"):
+    Game.init_display(audio=False, backend=backend)
+    if render_size:
+        Game.set_render_size(render_size)
+    Game.load_resources()
+    Game.create_ui()
+    Game.game["tank"] = Game.create_tank(Game.WIDTH // 2, Game.HEIGHT // 2)
+    Game.game["last_frame_time"] = Game.game["time"]
+
+def tank_safe_zone():
+    return Game.game["tank"].body_rect.inflate(100, 100)
+
+def drop_unsafe_targets(targets):
+    # Keep targets off the tank so the scenario stays in the playing state
+    targets.keep(~Game.bounds_overlap(Game.target_bounds(targets), tank_safe_zone()))
+
+def spawn_targets(targets, count):
+    while len(targets) < count:
+        spawned = Game.create_targets(count - len(targets), Game.level_configs[-1]["image"])
+        drop_unsafe_targets(spawned)
+        targets.extend(spawned.pos, spawned.vel, spawned.images)
+
+def spawn_bullet():
+    # Fire from the tank in a random direction without letting the recoil move it
+    tank = Game.game["tank"]
+    pos, prev_pos = pygame.math.Vector2(tank.pos), pygame.math.Vector2(tank.prev_pos)
+    tank.turret_angle = random.uniform(-math.pi, math.pi)
+    bullet = Game.shoot_tank(tank)
+    tank.pos.update(pos)
+    tank.prev_pos.update(prev_pos)
+    tank.body_rect.center = pos
+    return bullet
+
+def start_scenario(scenario, seed):
+    random.seed(seed)
+    Game.reset_to_menu()
+    if scenario["state"] == "playing":
+        Game.start_level()
+        Game.release_animations(Game.game["animations"])
+        Game.game["animations"] = []
+        Game.game["targets"] = Game.TargetStore()
+    refill_scenario(scenario)
+
+def refill_scenario(scenario):
+    # Top the entity counts back up outside the timed region so load stays constant
+    game = Game.game
+    if scenario["state"] != "playing":
+        return
+
+    game["state"] = "playing"
+    game["bullets_left"] = 10 ** 6
+    drop_unsafe_targets(game["targets"])
+    spawn_targets(game["targets"], scenario["targets"])
+    game["bullets"].extend(spawn_bullet() for _ in range(scenario["bullets"] - len(game["bullets"])))
+    game["collision_effects"].extend(Game.create_collision_effect(random.randint(0, Game.WIDTH), random.randint(0, Game.HEIGHT))
+                                     for _ in range(scenario["effects"] - len(game["collision_effects"])))
+
+# Measurement
+def run_scenario(scenario, frames, warmup, seed):
+    start_scenario(scenario, seed)
+    timings = {phase: [] for phase in PHASES}
+
+    for frame in range(warmup + frames):
+        refill_scenario(scenario)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=(random.randint(0, Game.WIDTH), random.randint(0, Game.HEIGHT)),
+                                             rel=(0, 0), buttons=(0, 0, 0)))
+
+        start = time.perf_counter()
+        Game.handle_events()
+        after_events = time.perf_counter()
+        Game.update_game()
+        after_update = time.perf_counter()
+        Game.draw_game()
+        after_draw = time.perf_counter()
+
+        if frame >= warmup:
+            timings["handle_events"].append(after_events - start)
+            timings["update_game"].append(after_update - after_events)
+            timings["draw_game"].append(after_draw - after_update)
+
+    return {phase: summarize(samples) for phase, samples in timings.items()}
+
+def summarize(samples):
+    samples_ms = np.array(samples) * 1000
+    summary = {"mean_ms": float(samples_ms.mean()), "max_ms": float(samples_ms.max())}
+    for percentile, value in zip(PERCENTILES, np.percentile(samples_ms, PERCENTILES)):
+        summary[f"p{percentile}_ms"] = float(value)
+    return summary
+
+# Baseline comparison
+def compare(results, baseline, metric, tolerance):
+    regressions = []
+    for name, phases in results["scenarios"].items():
+        for phase, summary in phases.items():
+            reference = baseline.get("scenarios", {}).get(name, {}).get(phase, {}).get(metric)
+            if not reference:
+                continue
+            ratio = summary[metric] / reference
+            status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+            print(f"{name:>10} {phase:>14} {metric}: {reference:8.3f} -> {summary[metric]:8.3f} ms ({ratio:5.2f}x) {status}", file=sys.stderr)
+            if status != "ok":
+                regressions.append((name, phase))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark for Container Tanker")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--frames", type=int, default=300, help="measured frames per scenario")
+    parser.add_argument("--warmup", type=int, default=30, help="unmeasured frames before each scenario")
+    parser.add_argument("--seed", type=int, default=1234, help="RNG seed for scenario setup")
+    parser.add_argument("--full-redraw", action="store_true", help="disable dirty-rect rendering")
+    parser.add_argument("--render-size", help="internal world resolution as WIDTHxHEIGHT (default: window size)")
+    parser.add_argument("--backend", choices=Game.RENDER_BACKENDS, default="surface", help="drawing backend, see Game.py --backend")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--metric", default="p90_ms", help="summary field compared against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown ratio before failing")
+    args = parser.parse_args()
+
+    if args.full_redraw:
+        Game.RENDER_DIRTY_RECTS = False
+    render_size = tuple(int(value) for value in args.render_size.lower().split("x")) if args.render_size else None
+    setup_game(render_size, args.backend)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "dirty_rects": Game.RENDER_DIRTY_RECTS,
+            "backend": Game.render["backend"],
+            "render_size": list(Game.view_size())
+        },
+        "scenarios": {}
+    }
+    for name in args.scenario or SCENARIOS:
+        results["scenarios"][name] = run_scenario(SCENARIOS[name], args.frames, args.warmup, args.seed)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.metric, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import os
+
+# Run without a window or sound card, must be set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import math
+import sys
+
+import numpy as np
+
+import Game
+
+SAMPLES = 4000
+
+# Scene building, targets are the 48 px level sprites and bullets the 16 px shell.
+# Filler targets sit in a row above the playfield, out of every bullet's reach, so the scene's own targets keep their
+# indices while the level grows past SPATIAL_HASH_MIN_TARGETS and the spatial hash path takes over
+def make_targets(centers, filler=0):
+    targets = Game.TargetStore()
+    centers = np.array(centers, dtype=float).reshape(-1, 2)
+    filler = np.column_stack((np.arange(filler) * 60.0, np.full(filler, -500.0)))
+    centers = np.concatenate((centers, filler))
+    targets.fill(centers, np.zeros_like(centers), Game.res["go_logo"])
+    return targets
+
+def make_bullet(start, end):
+    bullet = Game.Bullet()
+    bullet.image = Game.res["bullet_image"]
+    bullet.rect.size = bullet.image.get_size()
+    bullet.prev_pos.update(*start)
+    bullet.pos.update(*end)
+    bullet.rect.center = bullet.pos
+    return bullet
+
+def scene_hits(bullets, targets):
+    # The same call update_game makes, the grid is built once the level is big enough
+    bounds = Game.target_bounds(targets)
+    return Game.find_bullet_hits(bullets, bounds, Game.collision_grid(bounds), targets.pos - targets.prev_pos)
+
+def direction(angle):
+    return np.array((math.cos(angle), math.sin(angle)))
+
+# Checks, each returns the failed cases
+def check_crossing(rng, cases, filler=0):
+    # A bullet that starts and ends the tick clear of a target but passes through it in between hits it
+    failures = []
+    size = Game.res["go_logo"].get_width()
+    for case in range(cases):
+        center = rng.uniform(200, (Game.WIDTH - 200, Game.HEIGHT - 200))
+        path = direction(rng.uniform(0, 2 * math.pi))
+        side = np.array((-path[1], path[0])) * rng.uniform(-size / 2, size / 2)
+        reach = rng.uniform(60, 150)
+        start, end = center + side - path * reach, center + side + path * reach
+        hits = scene_hits([make_bullet(start, end)], make_targets([center], filler))
+        if hits != [(0, 0)]:
+            failures.append(f"crossing {start.round(1).tolist()} -> {end.round(1).tolist()} past {center.round(1).tolist()}: {hits}")
+    return failures
+
+def check_earliest(rng, cases, filler=0):
+    # A bullet crossing two targets hits the nearer one, a target two bullets cross goes to the one that gets there first
+    failures = []
+    for case in range(cases):
+        start = rng.uniform(300, (Game.WIDTH - 300, Game.HEIGHT - 300))
+        path = direction(rng.uniform(0, 2 * math.pi))
+        near, far = start + path * 80, start + path * 180
+        order = rng.permutation(2)
+        hits = scene_hits([make_bullet(start, start + path * 300)], make_targets(np.array((near, far))[order], filler))
+        if hits != [(0, int(np.argmin(order)))]:
+            failures.append(f"path {start.round(1).tolist()} along {path.round(3).tolist()}: {hits}, expected target {int(np.argmin(order))}")
+
+        center = start + path * 100
+        early, late = path, np.array((-path[1], path[0]))
+        bullets = [make_bullet(center - early * 100, center + early * 100), make_bullet(center - late * 250, center + late * 50)]
+        order = rng.permutation(2)
+        hits = scene_hits([bullets[index] for index in order], make_targets([center], filler))
+        if hits != [(int(np.argmin(order)), 0)]:
+            failures.append(f"two bullets at {center.round(1).tolist()}: {hits}, expected bullet {int(np.argmin(order))}")
+    return failures
+
+def check_sampling(rng, cases):
+    # sweep_times against the earliest overlap found by stepping both boxes through the tick
+    failures = []
+    times = np.linspace(0, 1, SAMPLES + 1)
+    for case in range(cases):
+        moving = rng.integers(0, 200, 2)
+        moving = np.concatenate((moving, moving + rng.integers(1, 40, 2)))[None]
+        bounds = rng.integers(0, 200, 2)
+        bounds = np.concatenate((bounds, bounds + rng.integers(1, 60, 2)))[None]
+        motion = rng.normal(0, 60, (1, 2))
+        if case % 5 == 0:
+            motion[0, case % 2] = 0
+        swept = Game.sweep_times(moving, bounds, motion)[0]
+        boxes = moving - (1 - times)[:, None] * np.tile(motion, 2)
+        overlap = np.flatnonzero((boxes[:, 0] < bounds[0, 2]) & (boxes[:, 2] > bounds[0, 0]) &
+                                 (boxes[:, 1] < bounds[0, 3]) & (boxes[:, 3] > bounds[0, 1]))
+        sampled = times[overlap[0]] if len(overlap) else math.nan
+        if math.isnan(sampled) != math.isnan(swept) or abs(sampled - swept) > 1 / SAMPLES:
+            failures.append(f"box {moving[0].tolist()} moving {motion[0].round(2).tolist()} against {bounds[0].tolist()}: "
+                            f"swept {swept}, sampled {sampled}")
+    return failures
+
+def check_grid(rng, cases):
+    # Levels big enough for the spatial hash find the same pairs and hits as testing every pair
+    failures = []
+    for case in range(cases):
+        targets = Game.TargetStore()
+        targets.fill(*Game.spawn_values(int(rng.integers(Game.SPATIAL_HASH_MIN_TARGETS, 4 * Game.SPATIAL_HASH_MIN_TARGETS)), rng),
+                     Game.res["go_logo"])
+        Game.update_targets(targets)
+        bounds, motion = Game.target_bounds(targets), targets.pos - targets.prev_pos
+        grid = Game.collision_grid(bounds)
+        starts = rng.uniform(0, (Game.WIDTH, Game.HEIGHT), (int(rng.integers(1, 50)), 2))
+        ends = starts + rng.normal(0, 80, starts.shape)
+        bullets = [make_bullet(start, end) for start, end in zip(starts, ends)]
+
+        queries = Game.rect_bounds(bullet.rect for bullet in bullets)
+        brute, hashed = Game.overlapping_pairs(bounds, queries), Game.overlapping_pairs(bounds, queries, grid)
+        if not all(np.array_equal(a, b) for a, b in zip(brute, hashed)):
+            failures.append(f"{len(bounds)} targets, {len(bullets)} bullets: pairs differ, {len(brute[0])} tested every pair, "
+                            f"{len(hashed[0])} through the grid")
+        brute, hashed = Game.find_bullet_hits(bullets, bounds, None, motion), Game.find_bullet_hits(bullets, bounds, grid, motion)
+        if brute != hashed:
+            failures.append(f"{len(bounds)} targets, {len(bullets)} bullets: hits differ, {brute} testing every pair, {hashed} through the grid")
+    return failures
+
+def check_edge(rng, cases):
+    # A bullet that crosses a target and leaves the screen in the same tick still hits it, through a whole update_game tick
+    failures = []
+    size = Game.res["go_logo"].get_width()
+    step = Game.BULLET_SPEED * Game.SIM_DT
+    Game.new_session(0)
+    Game.start_level()
+    Game.game["input"] = {"keys": Game.KeyState([]), "mouse_pos": (0, 0), "mouse_pressed": (False, False, False)}
+    for case in range(cases):
+        axis, far = int(rng.integers(2)), bool(rng.integers(2))
+        center = rng.uniform(200, (Game.WIDTH - 200, Game.HEIGHT - 200))
+        center[axis] = (Game.WIDTH, Game.HEIGHT)[axis] - size / 2 if far else size / 2
+        path = np.zeros(2)
+        path[axis] = 1 if far else -1
+        start = center + path * (size - step) / 2
+        Game.change_state("playing")
+        Game.release_bullets(Game.game["bullets"])
+        Game.game["targets"] = make_targets([center])
+        bullet = make_bullet(start, start)
+        bullet.vel.update(*(path * Game.BULLET_SPEED))
+        bullet.spawn_time = Game.game["time"]
+        Game.game["bullets"] = [bullet]
+        Game.update_game()
+        if len(Game.game["targets"]):
+            failures.append(f"leaving the screen from {start.round(1).tolist()} past {center.round(1).tolist()}: no hit")
+    return failures
+
+CHECKS = {
+    "crossing": check_crossing,
+    "earliest": check_earliest,
+    "sampling": check_sampling,
+    "crossing on the grid": lambda rng, cases: check_crossing(rng, cases, Game.SPATIAL_HASH_MIN_TARGETS),
+    "earliest on the grid": lambda rng, cases: check_earliest(rng, cases, Game.SPATIAL_HASH_MIN_TARGETS),
+    "grid": check_grid,
+    "edge": check_edge
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the swept bullet collisions of Container Tanker")
+    parser.add_argument("--cases", type=int, default=500, help="random cases per check")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random cases")
+    args = parser.parse_args()
+
+    Game.init_headless()
+    failed = 0
+    for name, check in CHECKS.items():
+        failures = check(np.random.default_rng(args.seed), args.cases)
+        print(f"{name}: {len(failures)} failures in {args.cases} cases")
+        for failure in failures[:5]:
+            print(f"  {failure}", file=sys.stderr)
+        failed += len(failures)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,492 @@
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import asyncio
+import math
+import random
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pygame
+
+import Game
+
+NET_PORT = 7777
+SNAPSHOT_RATE = 20
+INPUT_RATE = 60
+INTERPOLATION_SNAPSHOTS = 2
+POSITION_TOLERANCE = 0.05
+VELOCITY_TOLERANCE = 0.01
+MAX_SEND_BUFFER = 1 << 20
+STATS_HISTORY = 4096
+
+# Wire format: every message is a length and type header followed by the payload
+MESSAGE_HEADER = struct.Struct("<IB")
+MSG_HELLO, MSG_SNAPSHOT, MSG_INPUT = 1, 2, 3
+HELLO = struct.Struct("<HHHHH")
+INPUT = struct.Struct("<BhhB")
+SNAPSHOT_HEADER = struct.Struct("<IHH")
+SNAPSHOT_COUNTS = struct.Struct("<II")
+
+# Entity records: position and velocity anchored at a tick, clients extrapolate from the anchor until a new one arrives
+ENTITY_DTYPE = np.dtype([("id", "<u4"), ("tick", "<u4"), ("pos", "<f4", 2), ("vel", "<f4", 2)])
+TANK_DTYPE = np.dtype(ENTITY_DTYPE.descr + [("angle", "<f4"), ("turret", "<f4"), ("ammo", "<u2"), ("score", "<u2")])
+KINDS = {"tanks": TANK_DTYPE, "targets": ENTITY_DTYPE, "bullets": ENTITY_DTYPE}
+TANK_FIELDS = ["angle", "turret", "ammo", "score"]
+
+class Player:
+    __slots__ = ("id", "tank", "input", "shots", "ammo", "score", "writer")
+
+    def __init__(self, player_id, tank, writer):
+        self.id = player_id
+        self.tank = tank
+        self.input = {"keys": Game.KeyState(), "mouse_pos": (0, 0), "mouse_pressed": (False, False, False)}
+        self.shots = 0
+        self.ammo = 0
+        self.score = 0
+        self.writer = writer
+
+# Snapshot tables, arrays of records sorted by id
+def empty_table(kind):
+    return np.empty(0, dtype=KINDS[kind])
+
+def predict(table, tick):
+    # Velocities are per second like the game's, the anchors are ticks
+    return table["pos"] + table["vel"] * ((tick - table["tick"].astype(np.int64)) * Game.SIM_DT)[:, None]
+
+def diff_table(table, current, tick):
+    # Records the clients cannot extrapolate correctly from what they already hold, the ids that are gone,
+    # and the table clients will hold once they apply both
+    changed = np.ones(len(current), dtype=bool)
+    base = current.copy()
+    if len(table):
+        index = np.minimum(np.searchsorted(table["id"], current["id"]), len(table) - 1)
+        known = table["id"][index] == current["id"]
+        base[known] = table[index[known]]
+        changed = ~known
+        changed |= np.abs(predict(base, tick) - current["pos"]).max(axis=1, initial=0) > POSITION_TOLERANCE
+        changed |= np.abs(base["vel"] - current["vel"]).max(axis=1, initial=0) > VELOCITY_TOLERANCE
+        for field in TANK_FIELDS if current.dtype == TANK_DTYPE else []:
+            changed |= base[field] != current[field]
+    base[changed] = current[changed]
+    removed = table["id"][~np.isin(table["id"], current["id"], assume_unique=True)]
+    return current[changed], removed, base
+
+def apply_delta(table, updates, removed):
+    kept = table[~np.isin(table["id"], removed) & ~np.isin(table["id"], updates["id"])]
+    merged = np.concatenate((kept, updates))
+    return merged[np.argsort(merged["id"], kind="stable")]
+
+def encode_snapshot(tick, level, deltas):
+    parts = [SNAPSHOT_HEADER.pack(tick, level, 0)]
+    for kind in KINDS:
+        updates, removed = deltas[kind]
+        parts += [SNAPSHOT_COUNTS.pack(len(updates), len(removed)), updates.tobytes(), removed.astype("<u4").tobytes()]
+    return b"".join(parts)
+
+def decode_snapshot(payload):
+    tick, level, flags = SNAPSHOT_HEADER.unpack_from(payload)
+    offset = SNAPSHOT_HEADER.size
+    deltas = {}
+    for kind, dtype in KINDS.items():
+        updates, removed = SNAPSHOT_COUNTS.unpack_from(payload, offset)
+        offset += SNAPSHOT_COUNTS.size
+        deltas[kind] = (np.frombuffer(payload, dtype, updates, offset), np.frombuffer(payload, "<u4", removed, offset + updates * dtype.itemsize))
+        offset += updates * dtype.itemsize + removed * 4
+    return tick, level, deltas
+
+def pack_message(kind, payload):
+    return MESSAGE_HEADER.pack(len(payload), kind) + payload
+
+async def read_message(reader):
+    length, kind = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    return kind, await reader.readexactly(length)
+
+def pack_input(frame_input, shots):
+    keys = sum(1 << bit for bit, key in enumerate(Game.INPUT_KEYS) if frame_input["keys"][key])
+    x, y = (max(-32768, min(32767, int(value))) for value in frame_input["mouse_pos"])
+    return pack_message(MSG_INPUT, INPUT.pack(keys, x, y, min(shots, 255)))
+
+# Server
+def create_server_state(targets, ammo, snapshot_rate):
+    return {
+        "players": {},
+        "next_player": 1,
+        "tick": 0,
+        "level": 1,
+        "targets": targets,
+        "ammo": ammo,
+        "snapshot_interval": max(1, round(Game.TICK_RATE / snapshot_rate)),
+        "snapshot_rate": snapshot_rate,
+        "bullet_ids": {},
+        "bullet_owners": {},
+        "next_bullet": 0,
+        "tables": {kind: empty_table(kind) for kind in KINDS},
+        "stats": {"tick_times": deque(maxlen=STATS_HISTORY), "encode_times": deque(maxlen=STATS_HISTORY),
+                  "snapshot_bytes": deque(maxlen=STATS_HISTORY), "dropped": 0},
+        "rng": random.Random()
+    }
+
+def start_server_level(server):
+    # Every player shares the level, each with their own ammunition
+    config = Game.level_configs[(server["level"] - 1) % len(Game.level_configs)]
+    Game.game["level"] = server["level"]
+    Game.clear_entities()
+    Game.game["targets"] = Game.create_targets(server["targets"] or config["targets"], config["image"])
+    server["bullet_ids"], server["bullet_owners"] = {}, {}
+    for player in server["players"].values():
+        player.ammo = server["ammo"] or config["bullets"]
+
+def spawn_tank(server):
+    rng = server["rng"]
+    return Game.create_tank(rng.randint(100, Game.WIDTH - 100), rng.randint(100, Game.HEIGHT - 100))
+
+def server_tick(server):
+    # One fixed tick of the shared level, built from the same update functions as the single player game
+    game = Game.game
+    game["time"] += Game.SIM_DT
+    server["tick"] += 1
+    for player in server["players"].values():
+        if player.shots and player.ammo > 0:
+            bullet = Game.shoot_tank(player.tank)
+            game["bullets"].append(bullet)
+            server["bullet_ids"][bullet] = server["next_bullet"]
+            server["bullet_owners"][bullet] = player.id
+            server["next_bullet"] += 1
+            player.ammo -= 1
+        player.shots = 0
+        Game.update_tank(player.tank, player.input["keys"], player.input["mouse_pos"])
+
+    spent = Game.update_bullets(game["bullets"])
+    Game.update_targets(game["targets"])
+    bounds = Game.target_bounds(game["targets"])
+    grid = Game.collision_grid(bounds)
+
+    # A tank that rams a target loses a point and respawns instead of ending the game for everyone
+    for player in server["players"].values():
+        if Game.tank_hits_target(player.tank, bounds, grid):
+            player.score = max(0, player.score - 1)
+            player.tank = spawn_tank(server)
+    hits = Game.find_bullet_hits(game["bullets"], bounds, grid, game["targets"].pos - game["targets"].prev_pos)
+    for bullet_index, target_index in hits:
+        owner = server["players"].get(server["bullet_owners"][game["bullets"][bullet_index]])
+        if owner is not None:
+            owner.score += 1
+    Game.remove_hits(hits, spent)
+    server["bullet_ids"] = {bullet: server["bullet_ids"][bullet] for bullet in game["bullets"]}
+    server["bullet_owners"] = {bullet: server["bullet_owners"][bullet] for bullet in game["bullets"]}
+
+    # Cleared levels advance, a level nobody can finish any more restarts
+    if not len(game["targets"]):
+        server["level"] += 1
+        start_server_level(server)
+    elif not game["bullets"] and server["players"] and all(player.ammo == 0 for player in server["players"].values()):
+        start_server_level(server)
+
+def capture_tables(server):
+    # Current state as records anchored at this tick
+    tick = server["tick"]
+    players = sorted(server["players"].values(), key=lambda player: player.id)
+    tanks = np.zeros(len(players), dtype=TANK_DTYPE)
+    for row, player in zip(tanks, players):
+        tank = player.tank
+        row["id"], row["pos"], row["vel"] = player.id, (tank.pos.x, tank.pos.y), tuple((tank.pos - tank.prev_pos) / Game.SIM_DT)
+        row["angle"], row["turret"], row["ammo"], row["score"] = tank.angle, tank.turret_angle, player.ammo, player.score
+
+    store = Game.game["targets"]
+    targets = np.zeros(len(store), dtype=ENTITY_DTYPE)
+    targets["id"], targets["pos"], targets["vel"] = store.ids, store.pos, store.vel
+
+    bullets = np.zeros(len(Game.game["bullets"]), dtype=ENTITY_DTYPE)
+    for row, bullet in zip(bullets, Game.game["bullets"]):
+        row["id"], row["pos"], row["vel"] = server["bullet_ids"][bullet], (bullet.pos.x, bullet.pos.y), (bullet.vel.x, bullet.vel.y)
+    bullets = bullets[np.argsort(bullets["id"], kind="stable")]
+
+    for table in (tanks, targets, bullets):
+        table["tick"] = tick
+    return {"tanks": tanks, "targets": targets, "bullets": bullets}
+
+def broadcast_snapshot(server):
+    # Encoded once against the table every client holds, so the cost does not grow with the number of players
+    start = time.perf_counter()
+    current = capture_tables(server)
+    deltas = {}
+    for kind in KINDS:
+        updates, removed, server["tables"][kind] = diff_table(server["tables"][kind], current[kind], server["tick"])
+        deltas[kind] = (updates, removed)
+    message = pack_message(MSG_SNAPSHOT, encode_snapshot(server["tick"], server["level"], deltas))
+    server["stats"]["encode_times"].append(time.perf_counter() - start)
+    server["stats"]["snapshot_bytes"].append(len(message))
+
+    for player in list(server["players"].values()):
+        if player.writer.transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+            # A client that cannot keep up is dropped rather than buffered without limit
+            server["stats"]["dropped"] += 1
+            player.writer.close()
+            del server["players"][player.id]
+        else:
+            player.writer.write(message)
+
+def keyframe(server):
+    # The tables as every client currently holds them, sent as one delta from nothing
+    deltas = {kind: (table, np.empty(0, dtype="<u4")) for kind, table in server["tables"].items()}
+    return pack_message(MSG_SNAPSHOT, encode_snapshot(server["tick"], server["level"], deltas))
+
+async def handle_client(server, reader, writer):
+    writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    player = Player(server["next_player"], spawn_tank(server), writer)
+    server["next_player"] += 1
+    config = Game.level_configs[(server["level"] - 1) % len(Game.level_configs)]
+    player.ammo = server["ammo"] or config["bullets"]
+    server["players"][player.id] = player
+    writer.write(pack_message(MSG_HELLO, HELLO.pack(player.id, Game.TICK_RATE, server["snapshot_rate"], Game.WIDTH, Game.HEIGHT)))
+    writer.write(keyframe(server))
+    try:
+        while True:
+            kind, payload = await read_message(reader)
+            if kind == MSG_INPUT:
+                keys, x, y, shots = INPUT.unpack(payload)
+                player.input = {
+                    "keys": Game.KeyState(key for bit, key in enumerate(Game.INPUT_KEYS) if keys >> bit & 1),
+                    "mouse_pos": (x, y),
+                    "mouse_pressed": (False, False, False)
+                }
+                player.shots += shots
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        server["players"].pop(player.id, None)
+        writer.close()
+
+async def run_server(server, host, port, duration=None, ready=None):
+    listener = await asyncio.start_server(lambda reader, writer: handle_client(server, reader, writer), host, port)
+    if ready is not None:
+        ready.set_result(listener.sockets[0].getsockname()[1])
+    start_server_level(server)
+    start = next_tick = time.perf_counter()
+    async with listener:
+        while duration is None or time.perf_counter() - start < duration:
+            # Catch up on the ticks that are due, at most MAX_FRAME_TIME worth after a stall, then sleep until the next one
+            now = time.perf_counter()
+            next_tick = max(next_tick, now - Game.MAX_FRAME_TIME)
+            while next_tick <= now:
+                tick_start = time.perf_counter()
+                server_tick(server)
+                server["stats"]["tick_times"].append(time.perf_counter() - tick_start)
+                if server["tick"] % server["snapshot_interval"] == 0:
+                    broadcast_snapshot(server)
+                next_tick += Game.SIM_DT
+            await asyncio.sleep(max(0, next_tick - time.perf_counter()))
+        for player in list(server["players"].values()):
+            player.writer.close()
+
+# Client
+def create_client_state():
+    return {
+        "player": 0,
+        "tables": {kind: empty_table(kind) for kind in KINDS},
+        "history": deque(maxlen=INTERPOLATION_SNAPSHOTS + 2),
+        "snapshot_rate": SNAPSHOT_RATE,
+        "tick": 0,
+        "received_at": 0.0,
+        "level": 1,
+        "stats": {"bytes": 0, "snapshots": 0, "apply_times": deque(maxlen=STATS_HISTORY)}
+    }
+
+def client_receive(client, kind, payload):
+    client["stats"]["bytes"] += MESSAGE_HEADER.size + len(payload)
+    if kind == MSG_HELLO:
+        client["player"], tick_rate, client["snapshot_rate"], width, height = HELLO.unpack(payload)
+        if tick_rate != Game.TICK_RATE:
+            raise ValueError(f"server ticks at {tick_rate}, this client at {Game.TICK_RATE}")
+        return
+    start = time.perf_counter()
+    tick, level, deltas = decode_snapshot(payload)
+    for kind, (updates, removed) in deltas.items():
+        client["tables"][kind] = apply_delta(client["tables"][kind], updates, removed)
+
+    # Keep each snapshot evaluated at its own tick for interpolation
+    client["history"].append((tick, level, {kind: (table["id"], predict(table, tick), table)
+                                            for kind, table in client["tables"].items()}))
+    client["tick"], client["level"], client["received_at"] = tick, level, time.perf_counter()
+    client["stats"]["snapshots"] += 1
+    client["stats"]["apply_times"].append(time.perf_counter() - start)
+
+def interpolate_snapshots(client):
+    # Render a little in the past, between the two snapshots around that moment
+    history = client["history"]
+    if not history:
+        return None
+    ticks_per_snapshot = Game.TICK_RATE / client["snapshot_rate"]
+    render_tick = client["tick"] + (time.perf_counter() - client["received_at"]) * Game.TICK_RATE - INTERPOLATION_SNAPSHOTS * ticks_per_snapshot
+    older = newer = history[-1]
+    for entry in reversed(history):
+        older = entry
+        if entry[0] <= render_tick:
+            break
+        newer = entry
+    if newer is older or newer[1] != older[1]:
+        return newer[2]
+    t = min(1.0, max(0.0, (render_tick - older[0]) / (newer[0] - older[0])))
+    frame = {}
+    for kind, (ids, pos, table) in newer[2].items():
+        old_ids, old_pos, old_table = older[2][kind]
+        pos = pos.copy()
+        if len(old_ids):
+            index = np.minimum(np.searchsorted(old_ids, ids), len(old_ids) - 1)
+            found = old_ids[index] == ids
+            pos[found] = old_pos[index[found]] + (pos[found] - old_pos[index[found]]) * t
+        frame[kind] = (ids, pos, table)
+    return frame
+
+def draw_client(client, surface, tanks):
+    frame = interpolate_snapshots(client)
+    surface.blit(Game.get_background(), (0, 0))
+    if frame is None:
+        pygame.display.flip()
+        return
+    level_image = Game.level_configs[(client["level"] - 1) % len(Game.level_configs)]["image"]
+    size = np.array(level_image.get_size())
+    ids, pos, table = frame["targets"]
+    surface.blits([(level_image, topleft) for topleft in (Game.round_center(pos) - size // 2).tolist()], doreturn=False)
+    ids, pos, table = frame["bullets"]
+    for (x, y), (vx, vy) in zip(pos.tolist(), table["vel"].tolist()):
+        image = Game.get_rotated(Game.res["bullet_image"], -math.degrees(math.atan2(vy, vx)))
+        surface.blit(image, image.get_rect(center=(x, y)))
+
+    # Tank sprites are reused per player, only their pose comes from the snapshot
+    ids, pos, table = frame["tanks"]
+    for player_id, (x, y), row in zip(ids.tolist(), pos.tolist(), table):
+        tank = tanks.setdefault(player_id, Game.create_tank(x, y))
+        tank.pos.update(x, y)
+        tank.prev_pos.update(x, y)
+        tank.turret_angle = float(row["turret"])
+        tank.body_image = Game.get_rotated(tank.original_body_image, float(row["angle"]))
+        Game.draw_tank(tank, surface)
+        if player_id == client["player"]:
+            Game.draw_label("Ammo: ", int(row["ammo"]), Game.res["PENALTY_FONT"], Game.WHITE, (10, 10), surface)
+            Game.draw_label("Score: ", int(row["score"]), Game.res["PENALTY_FONT"], Game.WHITE, (10, 40), surface)
+    Game.draw_label("Level: ", client["level"], Game.res["PENALTY_FONT"], Game.WHITE, (10, 70), surface)
+    Game.draw_label("Players: ", len(ids), Game.res["PENALTY_FONT"], Game.WHITE, (10, 100), surface)
+    Game.render["dirty_rects"] = []
+    pygame.display.flip()
+
+async def receive_loop(client, reader):
+    try:
+        while True:
+            client_receive(client, *await read_message(reader))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+async def run_client(host, port):
+    # Interactive client: local input goes to the server, the world is drawn from interpolated snapshots
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client = create_client_state()
+    client_receive(client, *await read_message(reader))
+    Game.init_display((Game.WIDTH, Game.HEIGHT), audio=False)
+    Game.load_resources()
+    receiver = asyncio.ensure_future(receive_loop(client, reader))
+    tanks, shots = {}, 0
+    next_input = time.perf_counter()
+    while not receiver.done():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                receiver.cancel()
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                shots += 1
+        if time.perf_counter() >= next_input:
+            writer.write(pack_input(Game.read_input(), shots))
+            shots = 0
+            next_input += 1 / INPUT_RATE
+        draw_client(client, Game.screen, tanks)
+        await asyncio.sleep(1 / Game.FPS)
+    writer.close()
+
+async def run_bot_client(host, port, duration, seed):
+    # Simulated player for load tests: wanders, aims at random points and fires now and then, never draws
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client = create_client_state()
+    receiver = asyncio.ensure_future(receive_loop(client, reader))
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration and not receiver.done():
+        frame_input = {
+            "keys": Game.KeyState([rng.choice(Game.INPUT_KEYS)]),
+            "mouse_pos": (rng.randrange(Game.WIDTH), rng.randrange(Game.HEIGHT)),
+            "mouse_pressed": (False, False, False)
+        }
+        writer.write(pack_input(frame_input, int(rng.random() < 0.05)))
+        await asyncio.sleep(1 / INPUT_RATE)
+    receiver.cancel()
+    writer.close()
+    return client["stats"]
+
+# Load test
+def percentile_ms(samples, percentile):
+    return float(np.percentile(np.array(samples) * 1000, percentile)) if samples else 0.0
+
+async def load_test(clients, targets, seconds, snapshot_rate):
+    server = create_server_state(targets, 10 ** 4, snapshot_rate)
+    ready = asyncio.get_running_loop().create_future()
+    server_task = asyncio.ensure_future(run_server(server, "127.0.0.1", 0, seconds + 1, ready))
+    port = await ready
+    results = await asyncio.gather(*(run_bot_client("127.0.0.1", port, seconds, seed) for seed in range(clients)))
+    await server_task
+
+    stats = server["stats"]
+    received = sum(result["bytes"] for result in results)
+    return {
+        "clients": clients,
+        "targets": targets,
+        "ticks": server["tick"],
+        "tick_ms_mean": float(np.mean(stats["tick_times"]) * 1000),
+        "tick_ms_p99": percentile_ms(stats["tick_times"], 99),
+        "encode_ms_mean": float(np.mean(stats["encode_times"]) * 1000),
+        "snapshot_bytes_mean": float(np.mean(stats["snapshot_bytes"])),
+        "keyframe_bytes": len(keyframe(server)),
+        "client_kbps": received / max(clients, 1) / seconds / 1024,
+        "apply_ms_mean": float(np.mean([sample for result in results for sample in result["apply_times"]] or [0]) * 1000),
+        "dropped": stats["dropped"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Container Tanker multiplayer over TCP")
+    parser.add_argument("mode", choices=["server", "client", "loadtest"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=NET_PORT)
+    parser.add_argument("--snapshot-rate", type=int, default=SNAPSHOT_RATE, help="snapshots per second sent by the server")
+    parser.add_argument("--targets", type=int, nargs="+", default=[0], help="targets per level, 0 uses level_configs")
+    parser.add_argument("--ammo", type=int, default=0, help="bullets per player per level, 0 uses level_configs")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="simulated clients (loadtest)")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each load test run")
+    args = parser.parse_args()
+
+    if args.mode == "server":
+        Game.init_headless()
+        server = create_server_state(args.targets[0], args.ammo, args.snapshot_rate)
+        print(f"Serving on {args.host}:{args.port}")
+        asyncio.run(run_server(server, args.host, args.port))
+    elif args.mode == "client":
+        asyncio.run(run_client(args.host, args.port))
+    else:
+        Game.init_headless()
+        print(f"{'clients':>7} {'targets':>7} {'tick ms':>8} {'p99 ms':>7} {'encode ms':>9} {'snapshot B':>10} {'keyframe B':>10} "
+              f"{'KiB/s/client':>12} {'apply ms':>8} {'dropped':>7}")
+        for targets in args.targets:
+            for clients in args.clients:
+                row = asyncio.run(load_test(clients, targets, args.seconds, args.snapshot_rate))
+                print(f"{row['clients']:>7} {row['targets']:>7} {row['tick_ms_mean']:>8.3f} {row['tick_ms_p99']:>7.3f} "
+                      f"{row['encode_ms_mean']:>9.3f} {row['snapshot_bytes_mean']:>10.0f} {row['keyframe_bytes']:>10} "
+                      f"{row['client_kbps']:>12.1f} {row['apply_ms_mean']:>8.3f} {row['dropped']:>7}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import sys
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import hashlib
+import time
+
+import pygame
+
+import Game
+
+# Replay functions
+def state_digest():
+    # Fingerprint of the simulation state, equal digests mean the replay was reproduced exactly
+    game = Game.game
+    digest = hashlib.sha256(f"{game['state']}:{game['level']}:{game['bullets_left']}:{game['time']:.6f}".encode())
+    digest.update(f"{game['tank'].pos.x:.6f},{game['tank'].pos.y:.6f},{game['tank'].angle}".encode())
+    for x, y in game["targets"].pos.tolist() + [(bullet.pos.x, bullet.pos.y) for bullet in game["bullets"]]:
+        digest.update(f"{x:.6f},{y:.6f}".encode())
+    return digest.hexdigest()[:16]
+
+def run_replay(seed, frames, render, realtime):
+    Game.new_session(seed)
+    clock = pygame.time.Clock()
+    ticks = 0
+    for frame_ticks, frame_input, events in frames:
+        if not Game.replay_frame(frame_ticks, frame_input, events):
+            break
+        ticks += frame_ticks
+        if render:
+            Game.draw_game()
+        if realtime:
+            clock.tick(Game.FPS)
+    return ticks
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Container Tanker session")
+    parser.add_argument("recording", help="file written by Game.py --record")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times to replay the session")
+    parser.add_argument("--render", action="store_true", help="draw every frame in a window")
+    parser.add_argument("--realtime", action="store_true", help="pace frames at the game's FPS instead of running flat out")
+    args = parser.parse_args()
+
+    # The playfield size is part of the simulation, replay at the recorded one
+    seed, size, frames = Game.read_recording(args.recording)
+    if args.render:
+        Game.init_display(size, audio=False)
+        Game.load_resources()
+        Game.create_ui()
+        # The background video is purely visual, skip decoding it
+        Game.video["files"] = []
+        Game.video["frames"] = []
+    else:
+        Game.init_headless(size)
+
+    digests = set()
+    for run in range(args.repeat):
+        start = time.perf_counter()
+        ticks = run_replay(seed, frames, args.render, args.realtime)
+        elapsed = time.perf_counter() - start
+        digest = state_digest()
+        digests.add(digest)
+        simulated = ticks / Game.TICK_RATE
+        print(f"run {run + 1}: {len(frames)} frames, {ticks} ticks in {elapsed:.3f}s "
+              f"({ticks / max(elapsed, 1e-9):.0f} ticks/s, {simulated / max(elapsed, 1e-9):.1f}x real time), state {digest}")
+
+    if len(digests) > 1:
+        print("Replays diverged: the simulation is not deterministic", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import importlib
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import Game
+
+SHOT_INTERVAL = 30
+AIM_TOLERANCE = math.radians(3)
+DANGER_RADIUS = 150
+
+# Bot policies: called once per tick with the bot's own state and the game, return the frame input and events
+def idle_input(mouse_pos, keys=()):
+    return {"keys": Game.KeyState(keys), "mouse_pos": mouse_pos, "mouse_pressed": (False, False, False)}
+
+def click(mouse_pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=mouse_pos)
+
+def aim_policy(bot, game):
+    # Lead the nearest target, fire once the turret is on it, and back away from targets that get close
+    tank, targets = game["tank"], game["targets"]
+    if not len(targets):
+        return idle_input((0, 0)), []
+    offsets = targets.pos - (tank.pos.x, tank.pos.y)
+    distances = np.hypot(offsets[:, 0], offsets[:, 1])
+    nearest = int(distances.argmin())
+    lead = distances[nearest] / Game.BULLET_SPEED
+    aim_x, aim_y = (targets.pos[nearest] + targets.vel[nearest] * lead).tolist()
+    mouse_pos = (round(aim_x), round(aim_y))
+
+    keys = []
+    if distances[nearest] < DANGER_RADIUS:
+        heading = math.radians(tank.angle)
+        ahead = offsets[nearest, 0] * math.cos(heading) - offsets[nearest, 1] * math.sin(heading) > 0
+        keys.append(pygame.K_s if ahead else pygame.K_w)
+
+    # update_tank points the turret at last tick's mouse position, shoot_tank fires along it.
+    # Ammunition is scarce, so wait for the last shot to land before firing again
+    error = abs((math.atan2(aim_y - tank.pos.y, aim_x - tank.pos.x) - tank.turret_angle + math.pi) % (2 * math.pi) - math.pi)
+    events = []
+    if (error < AIM_TOLERANCE and not game["bullets"] and bot["tick"] - bot["last_shot"] >= SHOT_INTERVAL and
+            game["bullets_left"] > 0):
+        bot["last_shot"] = bot["tick"]
+        events.append(click(mouse_pos))
+    return idle_input(mouse_pos, keys), events
+
+def random_policy(bot, game):
+    # Baseline: wander and fire in random directions
+    rng = bot["rng"]
+    mouse_pos = (rng.randrange(Game.WIDTH), rng.randrange(Game.HEIGHT))
+    keys = [rng.choice([pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d])]
+    events = [click(mouse_pos)] if rng.random() < 1 / SHOT_INTERVAL else []
+    return idle_input(mouse_pos, keys), events
+
+POLICIES = {
+    "aim": aim_policy,
+    "random": random_policy
+}
+
+def load_policy(name):
+    # A built-in name, or module:function for a policy defined elsewhere
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, function = name.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+# Worker
+def init_worker(size):
+    Game.init_headless(size)
+
+def play_level(task):
+    candidate, level, config, seed, policy_name, max_ticks = task
+    policy = load_policy(policy_name)
+    Game.level_configs[level - 1].update(bullets=config["bullets"], targets=config["targets"])
+    Game.new_session(seed)
+    Game.game["level"] = level
+    Game.start_level()
+
+    bot = {"rng": random.Random(seed), "tick": 0, "last_shot": -SHOT_INTERVAL}
+    while Game.game["state"] == "playing" and bot["tick"] < max_ticks:
+        frame_input, events = policy(bot, Game.game)
+        if not Game.replay_frame(1, frame_input, events):
+            break
+        bot["tick"] += 1
+
+    return {
+        "candidate": candidate,
+        "level": level,
+        "won": Game.game["state"] == "end",
+        "bullets_used": config["bullets"] - Game.game["bullets_left"],
+        "seconds": bot["tick"] / Game.TICK_RATE
+    }
+
+# Aggregation
+def summarize(results, candidates):
+    grouped = {}
+    for result in results:
+        grouped.setdefault((result["candidate"], result["level"]), []).append(result)
+
+    summary = []
+    for candidate, levels in enumerate(candidates):
+        for level, config in enumerate(levels, 1):
+            games = grouped.get((candidate, level), [])
+            wins = [result for result in games if result["won"]]
+            summary.append({
+                "candidate": candidate,
+                "level": level,
+                "bullets": config["bullets"],
+                "targets": config["targets"],
+                "games": len(games),
+                "win_rate": len(wins) / max(len(games), 1),
+                "bullets_used": float(np.mean([result["bullets_used"] for result in games])) if games else 0.0,
+                "time_to_clear": float(np.mean([result["seconds"] for result in wins])) if wins else None
+            })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play for balancing Container Tanker levels")
+    parser.add_argument("--configs", help="JSON list of candidates, each a list of {bullets, targets} per level (default: level_configs)")
+    parser.add_argument("--games", type=int, default=100, help="games per level per candidate")
+    parser.add_argument("--policy", default="aim", help=f"bot policy: {', '.join(POLICIES)} or module:function")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, later games count up from it")
+    parser.add_argument("--max-seconds", type=float, default=120, help="simulated time limit per game")
+    parser.add_argument("--size", default=f"{Game.WIDTH}x{Game.HEIGHT}", help="playfield size as WIDTHxHEIGHT")
+    parser.add_argument("--output", help="write the summary JSON here")
+    args = parser.parse_args()
+
+    if args.configs:
+        with open(args.configs) as f:
+            candidates = json.load(f)
+    else:
+        candidates = [[{"bullets": config["bullets"], "targets": config["targets"]} for config in Game.level_configs]]
+    if any(len(levels) > len(Game.level_configs) for levels in candidates):
+        parser.error(f"candidates can have at most {len(Game.level_configs)} levels")
+    size = tuple(int(value) for value in args.size.lower().split("x"))
+    max_ticks = int(args.max_seconds * Game.TICK_RATE)
+    tasks = [(candidate, level, config, args.seed + game, args.policy, max_ticks)
+             for candidate, levels in enumerate(candidates)
+             for level, config in enumerate(levels, 1)
+             for game in range(args.games)]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes, init_worker, (size,)) as pool:
+        results = list(pool.imap_unordered(play_level, tasks, chunksize=max(1, len(tasks) // (args.processes * 8))))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results, candidates)
+    for row in summary:
+        clear = f"{row['time_to_clear']:6.1f}s" if row["time_to_clear"] is not None else "     -"
+        print(f"candidate {row['candidate']:>4} level {row['level']}: {row['bullets']:>3} bullets {row['targets']:>4} targets  "
+              f"win {row['win_rate']:6.1%}  bullets used {row['bullets_used']:6.1f}  clear {clear}")
+    print(f"{len(results)} games in {elapsed:.1f}s on {args.processes} processes ({len(results) / max(elapsed, 1e-9):.1f} games/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"policy": args.policy, "games": args.games, "seed": args.seed, "levels": summary}, f, indent=2)
+            f.write("\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
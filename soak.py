@@ -0,0 +1,106 @@
+import os
+
+# Run without a window or sound card, must be set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import gc
+import random
+import sys
+import time
+
+import pygame
+
+import Game
+import selfplay
+
+# Cycle driving
+def key(name):
+    return pygame.event.Event(pygame.KEYDOWN, key=name, mod=0, unicode="", scancode=0)
+
+def run_cycle(bot, max_ticks, draw_every):
+    # Menu, every level the bot can clear, then back to the menu from the end or game over screen
+    game = Game.game
+    Game.replay_frame(1, selfplay.idle_input((0, 0)), [key(pygame.K_s)])
+    ticks = 0
+    while ticks < max_ticks:
+        if game["state"] == "end" and game["level"] < len(Game.level_configs):
+            events = [key(pygame.K_SPACE)]
+            frame_input = selfplay.idle_input((0, 0))
+        elif game["state"] in ["end", "game_over"]:
+            break
+        elif game["state"] == "playing":
+            frame_input, events = selfplay.aim_policy(bot, game)
+        else:
+            frame_input, events = selfplay.idle_input((0, 0)), []
+        Game.replay_frame(1, frame_input, events)
+        Game.flush_sounds()
+        bot["tick"] += 1
+        ticks += 1
+        if ticks % draw_every == 0:
+            Game.draw_game()
+    outcome = (game["state"], game["level"])
+    if game["state"] in ["end", "game_over"]:
+        Game.replay_frame(1, selfplay.idle_input((0, 0)), [key(pygame.K_q)])
+    else:
+        # Out of time mid-level, there is no in-game way back to the menu
+        Game.reset_to_menu()
+    return ticks, outcome
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test: cycle Container Tanker through menu, play and end, watching memory")
+    parser.add_argument("--cycles", type=int, default=300, help="menu to play to end cycles")
+    parser.add_argument("--warmup", type=int, default=20, help="cycles before the baseline is taken, caches fill up during these")
+    parser.add_argument("--max-drift-mb", type=float, default=16, help="allowed resident memory growth after warmup")
+    parser.add_argument("--seed", type=int, default=0, help="session seed of the first cycle, later cycles count up from it")
+    parser.add_argument("--max-seconds", type=float, default=120, help="simulated time limit per cycle")
+    parser.add_argument("--draw-every", type=int, default=4, help="draw a frame every N ticks")
+    parser.add_argument("--tracemalloc", action="store_true", help="snapshot allocations at every state change and report the top growth sites")
+    parser.add_argument("--top", type=int, default=Game.MEMORY_TOP, help="growth sites listed per state")
+    args = parser.parse_args()
+
+    Game.init_display(audio=True)
+    Game.load_resources()
+    Game.create_ui()
+    Game.new_session(args.seed)
+    if args.tracemalloc:
+        Game.start_memory_diagnostics()
+    bot = {"rng": random.Random(args.seed), "tick": 0, "last_shot": -selfplay.SHOT_INTERVAL}
+    max_ticks = int(args.max_seconds * Game.TICK_RATE)
+
+    start = time.perf_counter()
+    baseline = peak = None
+    outcomes = {}
+    for cycle in range(1, args.cycles + 1):
+        ticks, outcome = run_cycle(bot, max_ticks, args.draw_every)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        gc.collect()
+        rss = Game.resident_memory()
+        if cycle == args.warmup:
+            baseline = peak = rss
+            Game.reset_memory_baseline()
+        elif baseline is not None:
+            peak = max(peak, rss)
+        if cycle % 10 == 0 or cycle == args.cycles:
+            drift = "" if baseline is None else f", drift {(rss - baseline) / 2 ** 20:+.1f} MiB"
+            print(f"cycle {cycle}: {ticks} ticks, RSS {rss / 2 ** 20:.1f} MiB{drift}")
+    elapsed = time.perf_counter() - start
+
+    if args.tracemalloc:
+        Game.print_memory_report(Game.memory_report(args.top))
+    print(f"{args.cycles} cycles in {elapsed:.1f}s, " +
+          ", ".join(f"{count}x {state} on level {level}" for (state, level), count in sorted(outcomes.items())))
+    if baseline is None:
+        print("Not enough cycles to measure drift, raise --cycles above --warmup", file=sys.stderr)
+        return 1
+    drift = (rss - baseline) / 2 ** 20
+    print(f"RSS after warmup {baseline / 2 ** 20:.1f} MiB, final {rss / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB, drift {drift:+.1f} MiB")
+    if drift > args.max_drift_mb:
+        print(f"Resident memory drifted more than {args.max_drift_mb} MiB", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())